@@ -7,12 +7,72 @@ efficient execution of external bioinformatics tools like `blastn` and `makeblas
 
 This approach allows multiple BLAST jobs to run concurrently, significantly
 speeding up the pipeline.
+
+Requires Python 3.11+: its subprocess machinery spawns children via
+posix_spawn rather than fork+exec, so launching a child never copies the
+parent's page tables — which matters here, where the parent can hold large
+parsed BLAST tables in memory while spawning many blastdbcmd/blastn
+processes.
 """
 import asyncio
+import os
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple
+
+# Concurrent BLAST coordination. Several blastn processes can run at once
+# (MLST + AMR + the batched standard search), so divide the machine into a
+# fixed number of slots: a semaphore admits at most _BLAST_SLOTS searches
+# while each search gets the slot's share of cores via -num_threads. When
+# the pipeline-level GA_MAX_CONCURRENCY cap admits fewer workflows than
+# there are slots, each search gets that larger share instead, so the box
+# stays fully used either way. Total BLAST threads never exceed
+# os.cpu_count().
+_BLAST_SLOTS = min(4, os.cpu_count() or 4)
+_PIPELINE_CAP = int(os.environ.get("GA_MAX_CONCURRENCY", 0)) or _BLAST_SLOTS
+_BLAST_THREADS = max(1, (os.cpu_count() or 4) // max(1, min(_BLAST_SLOTS, _PIPELINE_CAP)))
+_blast_slots = asyncio.Semaphore(_BLAST_SLOTS)
+
+# Bound the total number of live subprocesses. Spawning happens on the
+# event loop thread and serializes under the GIL, so an unbounded fan-out
+# (e.g. many concurrent blastdbcmd calls) causes spawn contention rather
+# than speedup. Python 3.11's subprocess machinery already uses
+# posix_spawn where possible, which keeps each individual spawn cheap.
+_SUBPROC_SEM = asyncio.Semaphore(min(32, (os.cpu_count() or 4) * 2))
+
+# Track repeated single-record blastn queries so we can flag callers that
+# split a batch into per-sequence runs (see run_blastn_async, Step 0).
+_single_record_runs = 0
+_SINGLE_RECORD_WARN_THRESHOLD = 3
 
-async def run_command_async(command: list) -> Tuple[bool, str, str]:
+
+def _count_fasta_records(fasta_file: Path, limit: int) -> int:
+    """
+    Counts FASTA records in a file, stopping early at `limit`.
+
+    Only used to detect the single-record anti-pattern, so it never needs
+    to scan past the second header.
+
+    Args:
+        fasta_file (Path): The FASTA file to inspect.
+        limit (int): Stop counting once this many records are seen.
+
+    Returns:
+        int: The number of records found (capped at `limit`), or 0 if the
+             file cannot be read.
+    """
+    count = 0
+    try:
+        with open(fasta_file, "rb") as f:
+            for line in f:
+                if line.startswith(b">"):
+                    count += 1
+                    if count >= limit:
+                        break
+    except OSError:
+        return 0
+    return count
+
+async def run_command_async(command: list, stdout_path: Path | None = None) -> Tuple[bool, str, str]:
     """
     Runs a given command in a subprocess asynchronously.
 
@@ -21,33 +81,47 @@ async def run_command_async(command: list) -> Tuple[bool, str, str]:
     to be more robust than `asyncio.create_subprocess_shell` by taking arguments
     as a list, which avoids shell injection issues.
 
+    When `stdout_path` is given, the child's stdout is redirected straight to
+    that file at the OS level instead of being buffered through Python. That
+    keeps memory O(1) for commands with large output (and skips the UTF-8
+    decode pass); the returned stdout string is empty in that case.
+
     Args:
         command (list): A list of strings representing the command and its arguments
                         (e.g., ["blastn", "-query", "q.fasta", ...]).
+        stdout_path (Path | None): Optional file to receive stdout directly.
+                                   Pass Path(os.devnull) to discard it.
 
     Returns:
         Tuple[bool, str, str]: A tuple containing:
             - bool: True if the command executed successfully (return code 0), False otherwise.
-            - str: The content of stdout from the command.
+            - str: The content of stdout from the command ('' when redirected).
             - str: The content of stderr from the command.
     """
     # Step 1: Ensure all parts of the command are strings for compatibility.
     cmd_str_list = [str(item) for item in command]
 
+    # Step 1b: Decide where stdout goes: a pipe we drain, or a file fd the
+    # child writes to directly.
+    stdout_fd = None
+    if stdout_path is not None:
+        stdout_fd = os.open(str(stdout_path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
     try:
-        # Step 2: Create the asynchronous subprocess.
-        # stdout and stderr are piped to be captured.
-        proc = await asyncio.create_subprocess_exec(
-            *cmd_str_list,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        # Step 3: Wait for the process to complete and communicate results.
-        stdout_bytes, stderr_bytes = await proc.communicate()
-        
+        # Step 2: Create the asynchronous subprocess, holding a slot in the
+        # process semaphore so concurrent callers cannot storm the spawner.
+        async with _SUBPROC_SEM:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd_str_list,
+                stdout=stdout_fd if stdout_fd is not None else asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+
+            # Step 3: Wait for the process to complete and communicate results.
+            stdout_bytes, stderr_bytes = await proc.communicate()
+
         # Step 4: Decode the byte output to strings.
-        stdout = stdout_bytes.decode('utf-8', errors='ignore')
+        stdout = stdout_bytes.decode('utf-8', errors='ignore') if stdout_bytes else ""
         stderr = stderr_bytes.decode('utf-8', errors='ignore')
 
         # Step 5: Return the success status and the captured output.
@@ -60,6 +134,28 @@ async def run_command_async(command: list) -> Tuple[bool, str, str]:
     except Exception as e:
         # Step 6b: Handle any other unexpected errors during subprocess execution.
         return False, "", f"An unexpected error occurred: {e}"
+    finally:
+        # Step 7: The parent's copy of the redirect fd is no longer needed.
+        if stdout_fd is not None:
+            os.close(stdout_fd)
+
+
+def blast_db_name(fasta_file: Path, db_output_dir: Path) -> Path:
+    """
+    Returns the base path a BLAST database for this FASTA file will get.
+
+    The name is deterministic, so callers can compute it before
+    `create_blast_db_async` has actually run (e.g. to build contexts while
+    the database is still being created).
+
+    Args:
+        fasta_file (Path): The path to the input FASTA file.
+        db_output_dir (Path): The directory holding the BLAST database files.
+
+    Returns:
+        Path: The base path of the database (without extension).
+    """
+    return db_output_dir / fasta_file.stem
 
 
 async def create_blast_db_async(fasta_file: Path, db_output_dir: Path) -> Path:
@@ -83,7 +179,7 @@ async def create_blast_db_async(fasta_file: Path, db_output_dir: Path) -> Path:
         RuntimeError: If the `makeblastdb` command fails.
     """
     # Step 1: Define the base name for the database from the input FASTA file.
-    db_name = db_output_dir / fasta_file.stem
+    db_name = blast_db_name(fasta_file, db_output_dir)
     
     # Step 2: Check if database files already exist to prevent re-creation.
     if not any(db_name.with_suffix(s).exists() for s in ['.nin', '.nhr', '.nsq']):
@@ -125,11 +221,26 @@ async def run_blastn_async(query_file: Path, db_path: Path, output_file: Path, o
     Raises:
         RuntimeError: If the `blastn` command fails and produces an error message.
     """
+    # Step 0: Guard the batching convention. Callers should concatenate
+    # their sequences into one multi-FASTA and BLAST once per database;
+    # repeated single-record invocations pay BLAST startup + DB index load
+    # for every sequence. Warn if that pattern shows up.
+    global _single_record_runs
+    if _count_fasta_records(query_file, limit=2) == 1:
+        _single_record_runs += 1
+        if _single_record_runs == _SINGLE_RECORD_WARN_THRESHOLD:
+            print(
+                f"Warning: {_single_record_runs} blastn runs with single-record "
+                "queries detected. Concatenate sequences into one multi-FASTA "
+                "and BLAST once per database instead."
+            )
+
     # Step 1: Define default BLAST options.
     default_opts = {
         "outfmt": "6", # Tabular output format
         "perc_identity": 95,
-        "qcov_hsp_perc": 95
+        "qcov_hsp_perc": 95,
+        "num_threads": _BLAST_THREADS
     }
     # Step 2: Merge user-provided options with defaults. User options take precedence.
     final_opts = {**default_opts, **options}
@@ -141,16 +252,180 @@ async def run_blastn_async(query_file: Path, db_path: Path, output_file: Path, o
         "-db", str(db_path),
         "-out", str(output_file)
     ]
-    
+
     # Step 4: Append the final options to the command list.
     for key, value in final_opts.items():
         command.extend([f"-{key}", str(value)])
 
-    # Step 5: Execute the command asynchronously.
-    success, stdout, stderr = await run_command_async(command)
+    # Step 5: Execute the command asynchronously, holding one BLAST slot so
+    # concurrent searches never oversubscribe the machine. Results go to
+    # `-out`, so whatever blastn prints to stdout is discarded at the OS
+    # level rather than drained through a pipe.
+    async with _blast_slots:
+        success, stdout, stderr = await run_command_async(command, stdout_path=Path(os.devnull))
     if not success:
         # Step 6: If the command fails, check for content in stderr and raise an error.
         # A non-zero exit code might occur even with no hits, but stderr content
         # usually indicates a genuine problem.
         if stderr:
             raise RuntimeError(f"blastn failed: {stderr}")
+
+
+# Sentinel used to tag query headers when several analyses are batched into
+# one blastn run; see run_blastn_batched_async / batch_sentinel.
+_BATCH_SENTINEL_FMT = "__PF_{}__"
+
+
+def batch_sentinel(analysis_name: str) -> str:
+    """
+    Returns the header-prefix sentinel used to tag a batched analysis.
+
+    Args:
+        analysis_name (str): The analysis name to encode in the sentinel.
+
+    Returns:
+        str: The prefix prepended to every query ID of that analysis.
+    """
+    return _BATCH_SENTINEL_FMT.format(analysis_name)
+
+
+async def _stream_query_groups(stdin, query_groups):
+    """
+    Feeds groups of FASTA files to a subprocess stdin in 1 MiB chunks.
+
+    Each group is a `(prefix, files)` pair; when `prefix` (bytes) is not None
+    it is inserted after every `>` that opens a record header, which is how
+    batched runs tag sequences with their owning analysis. The rewrite is
+    chunk-safe: a header split across two chunks is detected by tracking
+    whether the previous chunk ended with a newline.
+
+    Args:
+        stdin: The subprocess's stdin stream.
+        query_groups: A list of `(prefix: bytes | None, files: List[Path])` pairs.
+    """
+    for prefix, query_files in query_groups:
+        for query_file in query_files:
+            with open(query_file, "rb") as f_in:
+                at_line_start = True  # a file always starts at a line start
+                while chunk := await asyncio.to_thread(f_in.read, 1 << 20):
+                    if prefix is not None:
+                        if at_line_start and chunk.startswith(b">"):
+                            chunk = b">" + prefix + chunk[1:]
+                        chunk = chunk.replace(b"\n>", b"\n>" + prefix)
+                        at_line_start = chunk.endswith(b"\n")
+                    stdin.write(chunk)
+                    await stdin.drain()
+
+
+async def _run_blastn_over_stdin(query_groups, db_path: Path, output_file: Path, options: Dict):
+    """
+    Shared core for the stdin-fed blastn variants.
+
+    Args:
+        query_groups: `(prefix, files)` pairs as taken by `_stream_query_groups`.
+        db_path (Path): Path to the BLAST database to search against.
+        output_file (Path): Path where the BLAST results will be saved.
+        options (Dict): A dictionary of additional BLAST options.
+
+    Raises:
+        RuntimeError: If the `blastn` command fails and produces an error message.
+    """
+    # Step 1: Build the command with the same defaults as run_blastn_async,
+    # except the query comes from stdin.
+    default_opts = {
+        "outfmt": "6",
+        "perc_identity": 95,
+        "qcov_hsp_perc": 95,
+        "num_threads": _BLAST_THREADS
+    }
+    final_opts = {**default_opts, **options}
+
+    command = ["blastn", "-query", "-", "-db", str(db_path), "-out", str(output_file)]
+    for key, value in final_opts.items():
+        command.extend([f"-{key}", str(value)])
+
+    # Step 2: Spawn blastn and feed it the query files in 1 MiB chunks.
+    # Each drain() is a scheduling point, so sibling tasks keep progressing
+    # while blastn consumes its input at its own pace. Drain stderr
+    # concurrently so neither pipe can fill and deadlock, and tolerate the
+    # pipe breaking: if blastn dies mid-feed, the diagnostic we want is its
+    # stderr, not the BrokenPipeError from our write.
+    async with _blast_slots:
+        async with _SUBPROC_SEM:
+            proc = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            stderr_task = asyncio.create_task(proc.stderr.read())
+            try:
+                await _stream_query_groups(proc.stdin, query_groups)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Child exited early; its stderr explains why below.
+            finally:
+                proc.stdin.close()
+
+            stderr_bytes = await stderr_task
+            await proc.wait()
+
+    # Step 3: As with the file-based variant, treat stderr content on a
+    # non-zero exit as a genuine failure.
+    if proc.returncode != 0:
+        stderr = stderr_bytes.decode('utf-8', errors='ignore')
+        if stderr:
+            raise RuntimeError(f"blastn failed: {stderr}")
+
+
+async def run_blastn_stdin_async(query_files: List[Path], db_path: Path, output_file: Path, options: Dict):
+    """
+    Runs a BLASTN search, streaming the query FASTA files over stdin.
+
+    `blastn -query -` reads the query from stdin, so the caller's FASTA files
+    can be piped straight into the process instead of being concatenated into
+    an intermediate combined-query file on disk. That removes one full write
+    plus one full read of the query set from the hot path.
+
+    Related Functions:
+    - run_blastn_async: The file-based variant; shares the same defaults.
+    - run_blastn_batched_async: Streams several analyses into one search.
+
+    Args:
+        query_files (List[Path]): FASTA files streamed to blastn, in order.
+        db_path (Path): Path to the BLAST database to search against.
+        output_file (Path): Path where the BLAST results will be saved.
+        options (Dict): A dictionary of additional BLAST options.
+
+    Raises:
+        RuntimeError: If the `blastn` command fails and produces an error message.
+    """
+    await _run_blastn_over_stdin([(None, query_files)], db_path, output_file, options)
+
+
+async def run_blastn_batched_async(query_groups: List[Tuple[str, List[Path]]], db_path: Path,
+                                   output_file: Path, options: Dict):
+    """
+    Runs several analyses' queries through a single BLASTN invocation.
+
+    Each blastn process pays startup plus a full load of the genome DB index,
+    so N small per-analysis searches cost N times that fixed overhead. This
+    batches them: every group's sequence headers are tagged with the group's
+    sentinel (see `batch_sentinel`) while streaming over stdin, one search
+    runs, and the caller partitions the tabular output rows back into
+    per-analysis files by their qseqid prefix.
+
+    Args:
+        query_groups (List[Tuple[str, List[Path]]]): `(analysis_name, files)`
+            pairs; each analysis's query IDs get its sentinel as a prefix.
+        db_path (Path): Path to the BLAST database to search against.
+        output_file (Path): Path where the combined BLAST results are saved.
+        options (Dict): A dictionary of additional BLAST options.
+
+    Raises:
+        RuntimeError: If the `blastn` command fails and produces an error message.
+    """
+    prefixed_groups = [
+        (batch_sentinel(analysis_name).encode(), query_files)
+        for analysis_name, query_files in query_groups
+    ]
+    await _run_blastn_over_stdin(prefixed_groups, db_path, output_file, options)
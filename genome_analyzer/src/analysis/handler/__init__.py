@@ -9,6 +9,13 @@ chained together by the AnalysisManager.
 - `mlst.py`: Implements the multi-step MLST (Multi-Locus Sequence Typing) workflow.
 - `pathogen_finder.py`: Implements the PathogenFinder2 workflow.
 - `standard.py`: A generic handler for standard single-step BLAST analyses.
+
+Convention: handlers BLAST once per database, never once per sequence.
+Each workflow concatenates its query sequences into a single multi-FASTA
+and makes one `run_blastn_async` call against it, so BLAST's startup and
+DB index load are paid once instead of N times. New handlers should follow
+the same pattern (`run_blastn_async` warns when it sees repeated
+single-record queries).
 """
 from .base import AnalysisContext, AnalysisHandler
 from .mlst import MLSTHandler
@@ -16,8 +23,6 @@ from .pathogen_finder import PathogenFinder2Handler
 from .standard import StandardAnalysisHandler
 from .amr import AMRHandler
 
-from .amr import AMRHandler
-
 __all__ = [
     "AnalysisContext",
     "AnalysisHandler",
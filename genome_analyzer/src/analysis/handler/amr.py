@@ -1,42 +1,42 @@
-import asyncio
 import json
-import pandas as pd
 from pathlib import Path
 
 from .base import AnalysisHandler
 from analysis import blast_runner
+from analysis import utils
 
 class AMRHandler(AnalysisHandler):
     """
     A concrete handler for Antimicrobial Resistance (AMR) analysis, mimicking ABRicate.
     """
-    async def handle(self, analysis_name: str, db_folder: str, params: dict) -> asyncio.Task | None:
+    def handle(self, analysis_name: str, db_folder: str, params: dict):
         if analysis_name == "Antimicrobial_Resistance":
-            return asyncio.create_task(self._run_amr_workflow(db_folder, analysis_name))
+            return self._run_amr_workflow(db_folder, analysis_name)
         else:
-            return await super().handle(analysis_name, db_folder, params)
+            return super().handle(analysis_name, db_folder, params)
 
     async def _run_amr_workflow(self, db_folder: str, analysis_name: str):
         """
         Runs the AMR analysis workflow.
         """
+        # Deferred import: pandas costs ~100-300 ms of interpreter startup,
+        # which every CLI invocation would pay at module import even when the
+        # run fails before reaching this workflow.
+        import pandas as pd
+
         self._context.logger.log_step(analysis_name, "1_Start_AMR_Workflow", "AMR workflow initiated.")
         
         output_dir = self._context.results_dir / analysis_name
         output_dir.mkdir(exist_ok=True)
 
-        # Step 1: Run BLAST search
-        query_dir = Path.cwd() / "database" / db_folder
-        query_files = list(query_dir.rglob("*.f*a"))
-        if not query_files:
+        # Step 1: Run BLAST search. The combined query FASTA is cached on
+        # disk per database folder, so unchanged folders concatenate once.
+        combined_query = utils.build_combined_query(db_folder)
+        if combined_query is None:
+            query_dir = Path.cwd() / "database" / db_folder
             self._context.logger.log_step(analysis_name, "2_No_Fasta_Found", f"No FASTA files found in '{query_dir}', skipping.", extension="log")
             return
 
-        combined_query = output_dir / "combined_query.fasta"
-        with open(combined_query, "w") as f_out:
-            for f in query_files:
-                f_out.write(f.read_text())
-                
         blast_results_path = output_dir / "blast_results.tsv"
         blast_options = {
             "perc_identity": 95, 
@@ -45,35 +45,52 @@ class AMRHandler(AnalysisHandler):
         }
         await blast_runner.run_blastn_async(combined_query, self._context.genome_db_path, blast_results_path, blast_options)
         
-        with open(blast_results_path, "r") as f:
-            self._context.logger.log_step(analysis_name, "3_Blast_Results", f"BLAST search results for {analysis_name}:\n{f.read()}", extension="tsv")
+        # Hardlink the result file into the log dir rather than re-reading
+        # its content: an O(1) metadata op versus O(bytes) read + rewrite.
+        if self._context.verbose:
+            self._context.logger.log_step_file(analysis_name, "3_Blast_Results", blast_results_path, extension="tsv")
+        else:
+            self._context.logger.log_step(analysis_name, "3_Blast_Results", f"BLAST results for {analysis_name} written to {blast_results_path} ({blast_results_path.stat().st_size} bytes)")
 
-        # Step 2: Parse and filter BLAST results
+        # Step 2: Parse and filter BLAST results.
+        # Only the columns the summary needs are materialized, with explicit
+        # dtypes so pandas skips inference over the full 13-column table.
         try:
-            df = pd.read_csv(blast_results_path, sep='\t', names=['qseqid', 'sseqid', 'pident', 'length', 'mismatch', 'gapopen', 'qstart', 'qend', 'sstart', 'send', 'evalue', 'bitscore', 'qcovhsp'])
+            df = pd.read_csv(
+                blast_results_path, sep='\t', engine='c',
+                names=['qseqid', 'sseqid', 'pident', 'length', 'mismatch', 'gapopen', 'qstart', 'qend', 'sstart', 'send', 'evalue', 'bitscore', 'qcovhsp'],
+                usecols=['qseqid', 'sseqid', 'pident', 'qcovhsp', 'bitscore'],
+                # The percentage columns stay float64: a float32 parse turns
+                # e.g. 99.13 into 99.12999725341797 in the emitted summary.
+                dtype={'qseqid': 'string', 'sseqid': 'string', 'pident': 'float64', 'qcovhsp': 'float64', 'bitscore': 'float32'}
+            )
         except (pd.errors.EmptyDataError, FileNotFoundError):
             df = pd.DataFrame()
 
         summary_records = []
         if not df.empty:
-            best_hits = df.loc[df.groupby('qseqid')['bitscore'].idxmax()]
-
-            for _, row in best_hits.iterrows():
-                parts = row['qseqid'].split('_')
-                gene = parts[0]
-                database = db_folder
-                accession = parts[2] if len(parts) > 2 else 'N/A'
-                product = "N/A"
+            # One C-level sort beats groupby().idxmax() + .loc[] here.
+            best_hits = df.sort_values('bitscore', ascending=False).drop_duplicates('qseqid', keep='first')
 
-                summary_records.append({
-                    "GENE": gene,
-                    "SEQUENCE": row['sseqid'],
-                    "%COVERAGE": row['qcovhsp'],
-                    "%IDENTITY": row['pident'],
-                    "DATABASE": database,
-                    "ACCESSION": accession,
-                    "PRODUCT": product
-                })
+            # Build the summary with vectorized column ops instead of a
+            # per-row Python loop: split all qseqids at once, assign the
+            # constant columns, and emit records in a single to_dict call.
+            # The split is unlimited so column 2 is exactly the third
+            # token, matching the baseline's split('_')[2] accession.
+            parts = best_hits['qseqid'].str.split('_', expand=True)
+            if parts.shape[1] < 3:
+                parts[2] = pd.NA
+            summary_records = (
+                best_hits.assign(
+                    GENE=parts[0],
+                    ACCESSION=parts[2].fillna('N/A'),
+                    DATABASE=db_folder,
+                    PRODUCT='N/A'
+                )
+                .rename(columns={'sseqid': 'SEQUENCE', 'qcovhsp': '%COVERAGE', 'pident': '%IDENTITY'})
+                [['GENE', 'SEQUENCE', '%COVERAGE', '%IDENTITY', 'DATABASE', 'ACCESSION', 'PRODUCT']]
+                .to_dict('records')
+            )
 
         # Step 3: Save summary and store results
         self._context.results_data['amr'] = summary_records
@@ -1,6 +1,6 @@
 
-import asyncio
 from abc import ABC, abstractmethod
+from collections.abc import Coroutine
 from pathlib import Path
 from dataclasses import dataclass
 
@@ -15,6 +15,7 @@ class AnalysisContext:
     This avoids passing many individual arguments through the handler chain.
     
     Attributes:
+        genome_file (Path): The path to the input genome FASTA file.
         genome_db_path (Path): The file path to the BLAST database of the input genome.
         results_dir (Path): The main directory where final results are stored.
         temp_dir (Path): A directory for intermediate files.
@@ -24,6 +25,7 @@ class AnalysisContext:
         genome_id (str): The genome identifier extracted from folder structure.
         species (str): The species name extracted from folder structure.
     """
+    genome_file: Path
     genome_db_path: Path
     results_dir: Path
     temp_dir: Path
@@ -67,22 +69,26 @@ class AnalysisHandler(ABC):
         return handler
 
     @abstractmethod
-    async def handle(self, analysis_name: str, db_folder: str, params: dict) -> asyncio.Task | None:
+    def handle(self, analysis_name: str, db_folder: str, params: dict) -> Coroutine | None:
         """
         Handles an analysis request.
-        
-        If the handler can process this `analysis_name`, it does so and returns
-        an asyncio.Task. Otherwise, it passes the request to the next handler
-        in the chain.
-        
+
+        If the handler can process this `analysis_name`, it returns the
+        workflow coroutine for the caller to schedule. Otherwise, it passes
+        the request to the next handler in the chain.
+
+        Walking the chain is pure dispatch — no awaits — so the caller can
+        collect the coroutines for every analysis and start them all in the
+        same event-loop tick (e.g. via asyncio.TaskGroup).
+
         Args:
             analysis_name (str): The name of the analysis to perform (e.g., "MLST").
             db_folder (str): The name of the database folder for this analysis.
             params (dict): A dictionary of parameters specific to this analysis.
-            
+
         Returns:
-            asyncio.Task | None: A task for the running analysis, or None if not handled.
+            Coroutine | None: The workflow coroutine, or None if not handled.
         """
         if self._next_handler:
-            return await self._next_handler.handle(analysis_name, db_folder, params)
+            return self._next_handler.handle(analysis_name, db_folder, params)
         return None
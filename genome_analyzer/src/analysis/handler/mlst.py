@@ -1,16 +1,42 @@
 
 import asyncio
-import re
-from typing import List
-import pandas as pd
-from Bio import SeqIO
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List
 
 from .base import AnalysisHandler
 from analysis import blast_runner
+from analysis import utils
 from config import DATABASE_ROOT
 
 import json
 
+
+
+def _parse_fasta(path: Path) -> Dict[str, str]:
+    """
+    Parses a FASTA file into a {record_id: sequence} dict in one pass.
+
+    Record IDs are the first whitespace-separated token after '>'.
+    """
+    sequences: Dict[str, str] = {}
+    name = None
+    chunks: List[str] = []
+    with open(path, "r") as fh:
+        for line in fh:
+            if line.startswith(">"):
+                if name is not None:
+                    sequences[name] = "".join(chunks)
+                name = line[1:].split()[0] if line[1:].strip() else ""
+                chunks = []
+            else:
+                chunks.append(line.strip())
+    if name is not None:
+        sequences[name] = "".join(chunks)
+    return sequences
+
+
 class MLSTHandler(AnalysisHandler):
     """
     A concrete handler for the special multi-step MLST workflow.
@@ -18,11 +44,20 @@ class MLSTHandler(AnalysisHandler):
     This handler checks if the requested analysis is "MLST". If so, it executes
     the complex MLST logic. Otherwise, it passes the request to the next handler.
     """
-    async def handle(self, analysis_name: str, db_folder: str, params: dict) -> asyncio.Task | None:
+    def __init__(self, context):
+        super().__init__(context)
+        # Per-instance caches: the profile file is read once per handler and
+        # reused both for the loci order and for the ST lookup table.
+        self._loci_order: List[str] | None = None
+        self._st_lookup: dict | None = None
+        self._st_key_cols: List[str] = []
+        self._st_lookup_file = None
+
+    def handle(self, analysis_name: str, db_folder: str, params: dict):
         # Step 1: Check if this handler is responsible for the analysis.
         if analysis_name == "MLST":
-            # Step 2: If responsible, create and return a task for the specific workflow.
-            # Use species from context instead of parameters
+            # Step 2: If responsible, return the workflow coroutine for the
+            # caller to schedule. Use species from context instead of parameters.
             mlst_params = {
                 'species': self._context.species,
                 'gene_dir': DATABASE_ROOT / "MLST_DB" / self._context.species,
@@ -30,10 +65,10 @@ class MLSTHandler(AnalysisHandler):
                 'loci_order': self._get_loci_order_from_profile(),
                 'genome_id': self._context.genome_id
             }
-            return asyncio.create_task(self._run_mlst_workflow(mlst_params))
+            return self._run_mlst_workflow(mlst_params)
         else:
             # Step 3: If not responsible, pass the request to the next handler in the chain.
-            return await super().handle(analysis_name, db_folder, params)
+            return super().handle(analysis_name, db_folder, params)
 
     def _get_loci_order_from_profile(self) -> List[str]:
         """
@@ -42,6 +77,8 @@ class MLSTHandler(AnalysisHandler):
         Returns:
             List[str]: List of loci in the order they appear in the profile file.
         """
+        if self._loci_order is not None:
+            return self._loci_order
         profile_file = DATABASE_ROOT / "MLST_DB" / self._context.species / f"{self._context.species}.txt"
         try:
             with open(profile_file, 'r') as f:
@@ -49,7 +86,8 @@ class MLSTHandler(AnalysisHandler):
                 lines = f.readlines()
                 if len(lines) > 0:
                     loci_line = lines[0].strip()
-                    return loci_line.split('\t')[1:]  # Skip first column (ST)
+                    self._loci_order = loci_line.split('\t')[1:]  # Skip first column (ST)
+                    return self._loci_order
                 else:
                     self._context.logger.log_step("MLST", "Profile_Error", "Profile file is empty.")
                     return []
@@ -93,104 +131,183 @@ class MLSTHandler(AnalysisHandler):
         self._context.logger.log_step("MLST", "6_End_MLST_Workflow", f"MLST workflow completed. Found ST: {st}, Profile: {profile}")
 
     async def _extract_housekeeping_genes(self, gene_dir, loci_order, blast_options):
+        # The probes FASTA comes from the pickled MLST DB index: on a warm
+        # run this is one pickle load instead of a read per locus TFA.
+        index = await asyncio.to_thread(utils.load_or_build_mlst_index, gene_dir)
         probes_fasta = self._context.temp_dir / "mlst_probes.fasta"
-        with open(probes_fasta, "w") as f_out:
-            for locus in loci_order:
-                record = next(SeqIO.parse(gene_dir / f"{locus}.tfa", "fasta"))
-                SeqIO.write(record, f_out, "fasta")
+        with open(probes_fasta, "wb") as f_out:
+            f_out.write(index["probes"])
 
         blast_result_path = self._context.temp_dir / "probes_vs_genome.tsv"
         await blast_runner.run_blastn_async(probes_fasta, self._context.genome_db_path, blast_result_path, blast_options)
         
-        with open(blast_result_path, "r") as f:
-            self._context.logger.log_step("MLST","3_Housekeeping_Gene_Blast_Results", f"BLAST search results for housekeeping genes:\n{f.read()}", extension="tsv")
+        # Hardlink the result file into the log dir rather than re-reading
+        # its content: an O(1) metadata op versus O(bytes) read + rewrite.
+        if self._context.verbose:
+            self._context.logger.log_step_file("MLST", "3_Housekeeping_Gene_Blast_Results", blast_result_path, extension="tsv")
+        else:
+            self._context.logger.log_step("MLST", "3_Housekeeping_Gene_Blast_Results", f"Housekeeping gene BLAST results written to {blast_result_path} ({blast_result_path.stat().st_size} bytes)")
 
-        try:
-            df = pd.read_csv(blast_result_path, sep='\t', names=['qseqid', 'sseqid', 'pident', 'length', 'mismatch', 'gapopen', 'qstart', 'qend', 'sstart', 'send', 'evalue', 'bitscore'])
-            best_hits = df.loc[df.groupby('qseqid')['bitscore'].idxmax()]
-        except (pd.errors.EmptyDataError, KeyError):
-            best_hits = pd.DataFrame()
+        # A single csv pass with a running-maximum dict replaces the pandas
+        # parse + sort + dedup: these probe tables are a few thousand rows
+        # at most, where DataFrame construction dominates the actual work.
+        best_hits = utils.best_hits_by_qseqid(blast_result_path)
 
         extracted_genes_path = self._context.temp_dir / "extracted_mlst_genes.fasta"
         with open(extracted_genes_path, "w") as f:
-            if not best_hits.empty:
-                for _, row in best_hits.iterrows():
-                    locus = row['qseqid'].split('_')[0]
-                    start, end = sorted((row['sstart'], row['send']))
-                    strand = "plus" if row['sstart'] < row['send'] else "minus"
-                    
-                    success, stdout, stderr = await blast_runner.run_command_async(
-                        ["blastdbcmd", "-db", str(self._context.genome_db_path), "-entry", row['sseqid'], "-range", f"{start}-{end}", "-strand", strand]
-                    )
-                    if success and stdout and stdout.startswith('>'):
-                        sequence = "".join(stdout.splitlines()[1:])
+            if best_hits:
+                # Batch all extractions into a single blastdbcmd call via
+                # -entry_batch: one line per locus with range and strand.
+                # This replaces N subprocess spawns (and N DB opens) with one.
+                loci = []
+                ranges = []
+                for qseqid, row in best_hits.items():
+                    sstart, send = int(row[8]), int(row[9])
+                    loci.append(qseqid.split('_')[0])
+                    if sstart < send:
+                        ranges.append((row[1], sstart, send, "plus"))
+                    else:
+                        ranges.append((row[1], send, sstart, "minus"))
+                batch_file = self._context.temp_dir / "blastdbcmd_batch.txt"
+                with open(batch_file, "w") as batch:
+                    batch.write("\n".join(
+                        f"{sseqid} {start}-{end} {strand}"
+                        for sseqid, start, end, strand in ranges
+                    ) + "\n")
+
+                success, stdout, stderr = await blast_runner.run_command_async(
+                    ["blastdbcmd", "-db", str(self._context.genome_db_path), "-entry_batch", str(batch_file), "-outfmt", "%f"]
+                )
+                if success and stdout and stdout.startswith('>'):
+                    # blastdbcmd preserves the batch-file order, so records
+                    # map positionally back to the loci list.
+                    records = stdout.lstrip('>').split('\n>')
+                    for locus, record in zip(loci, records):
+                        sequence = "".join(record.splitlines()[1:])
                         if sequence:
                             f.write(f">{locus}\n{sequence}\n")
-                    else:
-                        self._context.logger.log_step("MLST", f"Extraction_Failed_{locus}", f"blastdbcmd failed for {locus}.\nStderr: {stderr}")
+                else:
+                    # Fallback: some older blastdbcmd builds mishandle
+                    # -entry_batch with ranges. Re-issue one call per locus,
+                    # but gather them so the subprocesses run concurrently
+                    # instead of awaiting each in turn.
+                    self._context.logger.log_step("MLST", "Batch_Extraction_Failed", f"Batched blastdbcmd failed, retrying per-locus.\nStderr: {stderr}")
+                    results = await asyncio.gather(*[
+                        blast_runner.run_command_async(
+                            ["blastdbcmd", "-db", str(self._context.genome_db_path), "-entry", sseqid, "-range", f"{start}-{end}", "-strand", strand]
+                        )
+                        for sseqid, start, end, strand in ranges
+                    ])
+                    for locus, (success, stdout, stderr) in zip(loci, results):
+                        if success and stdout and stdout.startswith('>'):
+                            sequence = "".join(stdout.splitlines()[1:])
+                            if sequence:
+                                f.write(f">{locus}\n{sequence}\n")
+                        else:
+                            self._context.logger.log_step("MLST", f"Extraction_Failed_{locus}", f"blastdbcmd failed for {locus}.\nStderr: {stderr}")
         
-        with open(extracted_genes_path, "r") as f:
-            self._context.logger.log_step("MLST", "4_Extracted_Genes_Content", f"Content of extracted_mlst_genes.fasta:\n\n{f.read()}", extension="fasta")
+        if self._context.verbose:
+            self._context.logger.log_step_file("MLST", "4_Extracted_Genes_Content", extracted_genes_path, extension="fasta")
+        else:
+            self._context.logger.log_step("MLST", "4_Extracted_Genes_Content", f"Extracted MLST genes written to {extracted_genes_path} ({extracted_genes_path.stat().st_size} bytes)")
         
         return extracted_genes_path
 
     async def _determine_allele_profile(self, extracted_genes_path, gene_dir, loci_order, blast_options):
-        combined_alleles = self._context.temp_dir / "all_alleles.fasta"
-        with open(combined_alleles, "w") as f_out:
-            for locus_file in gene_dir.glob("*.tfa"):
-                f_out.write(locus_file.read_text())
-        
-        allele_db_path = await blast_runner.create_blast_db_async(combined_alleles, self._context.temp_dir)
+        # Cache the combined allele BLAST DB next to the source TFAs: the
+        # alleles rarely change between genomes, so the concatenation and
+        # makeblastdb run are skipped whenever the cached DB is newer than
+        # every source file.
+        cache_dir = gene_dir / "_blastdb"
+        cache_dir.mkdir(exist_ok=True)
+        combined_alleles = cache_dir / "all_alleles.fasta"
+        db_index = cache_dir / "all_alleles.nin"
+        # os.scandir exposes name and stat per entry in one pass, skipping
+        # glob's per-file Path construction and extra stat syscalls.
+        with os.scandir(gene_dir) as it:
+            scan = [(e.path, e.stat().st_mtime) for e in it if e.name.endswith(".tfa")]
+        tfa_files = sorted(path for path, _ in scan)
+        src_mtime = max((mtime for _, mtime in scan), default=0.0)
+
+        if not db_index.exists() or db_index.stat().st_mtime < src_mtime:
+            # Stream bytes through a fixed 1 MiB buffer instead of
+            # read_text(), which decodes and re-encodes every file.
+            with open(combined_alleles, "wb") as f_out:
+                for locus_file in tfa_files:
+                    with open(locus_file, "rb") as f_in:
+                        shutil.copyfileobj(f_in, f_out, 1 << 20)
+            # Drop any stale index files so create_blast_db_async rebuilds.
+            for suffix in ('.nin', '.nhr', '.nsq'):
+                combined_alleles.with_suffix(suffix).unlink(missing_ok=True)
+
+        allele_db_path = await blast_runner.create_blast_db_async(combined_alleles, cache_dir)
         
         blast_alleles_path = self._context.temp_dir / "genes_vs_alleles.tsv"
         await blast_runner.run_blastn_async(extracted_genes_path, allele_db_path, blast_alleles_path, blast_options)
         
-        with open(blast_alleles_path, "r") as f:
-            self._context.logger.log_step("MLST", "5_Allele_Blast_Results", f"BLAST results for allele determination:\n{f.read()}", extension="tsv")
+        if self._context.verbose:
+            self._context.logger.log_step_file("MLST", "5_Allele_Blast_Results", blast_alleles_path, extension="tsv")
+        else:
+            self._context.logger.log_step("MLST", "5_Allele_Blast_Results", f"Allele BLAST results written to {blast_alleles_path} ({blast_alleles_path.stat().st_size} bytes)")
 
-        try:
-            df_alleles = pd.read_csv(blast_alleles_path, sep='\t', names=['qseqid', 'sseqid', 'pident', 'length', 'mismatch', 'gapopen', 'qstart', 'qend', 'sstart', 'send', 'evalue', 'bitscore'])
-            best_alleles = df_alleles.loc[df_alleles.groupby('qseqid')['bitscore'].idxmax()]
-        except (pd.errors.EmptyDataError, KeyError):
-            best_alleles = pd.DataFrame()
+        # Same single-pass best-hit dict as the probe step: loci_order is a
+        # handful of keys, so dict lookups beat DataFrame row selection.
+        best_alleles = utils.best_hits_by_qseqid(blast_alleles_path)
 
         profile = {}
         novel_alleles = []
         output_dir = self._context.results_dir / "MLST"
 
-        extracted_sequences = {record.id: record for record in SeqIO.parse(extracted_genes_path, "fasta")}
+        extracted_sequences = _parse_fasta(extracted_genes_path)
 
         for locus in loci_order:
-            hit = best_alleles[best_alleles['qseqid'] == locus] if not best_alleles.empty else pd.DataFrame()
-            if not hit.empty:
-                pident = hit.iloc[0]['pident']
+            hit = best_alleles.get(locus)
+            if hit is not None:
+                pident = float(hit[2])
                 if pident >= 100.0:
-                    allele_id = hit.iloc[0]['sseqid']
-                    allele_num_match = re.search(r'(\d+)', allele_id)
-                    profile[locus] = allele_num_match.group(1) if allele_num_match else "?"
+                    allele_id = hit[1]
+                    # Allele IDs end in their number (e.g. 'gapA_42'); taking
+                    # the tail after the last '_' avoids regex execution on a
+                    # tiny, predictable string.
+                    tail = allele_id.rpartition('_')[2]
+                    profile[locus] = tail if tail.isdigit() else "?"
                 else:
                     profile[locus] = f"novel({pident:.2f}%)"
                     if locus in extracted_sequences:
-                        novel_record = extracted_sequences[locus]
-                        novel_record.id = f"{locus}_novel"
-                        novel_record.description = f"Novel allele for {locus}"
-                        novel_alleles.append(novel_record)
+                        novel_alleles.append((f"{locus}_novel", f"Novel allele for {locus}", extracted_sequences[locus]))
             else:
                 profile[locus] = "?"
 
         if novel_alleles:
             novel_alleles_path = output_dir / "novel_alleles.fasta"
             with open(novel_alleles_path, "w") as f:
-                SeqIO.write(novel_alleles, f, "fasta")
+                for record_id, description, sequence in novel_alleles:
+                    f.write(f">{record_id} {description}\n{sequence}\n")
             self._context.logger.log_step("MLST", "Novel_Alleles_Found", f"Found {len(novel_alleles)} novel alleles. Saved to {novel_alleles_path}")
 
         return profile
 
+    def _get_st_lookup(self, profile_file) -> dict:
+        """
+        Builds (and caches) the allele-tuple -> ST lookup for a profile file.
+
+        The profile table is read once per handler instance; every ST query
+        afterwards is an O(1) dict lookup instead of a row scan.
+
+        Returns:
+            dict: Mapping of tuple(allele numbers, in column order) to ST.
+        """
+        if self._st_lookup is None or self._st_lookup_file != profile_file:
+            # The lookup is built once per database update and pickled next
+            # to the profile; warm runs just load the pickle.
+            index = utils.build_st_index(profile_file)
+            self._st_key_cols = index["key_cols"]
+            self._st_lookup = index["lookup"]
+            self._st_lookup_file = profile_file
+        return self._st_lookup
+
     def _find_sequence_type(self, profile, profile_file):
-        profile_df = pd.read_csv(profile_file, sep='\t').astype(str)
-        st = "Novel Profile"
-        for _, row in profile_df.iterrows():
-            if list(row[profile_df.columns[1:]]) == [profile.get(locus, "?") for locus in profile_df.columns[1:]]:
-                st = f"ST{row['ST']}"
-                break
-        return st
+        lookup = self._get_st_lookup(profile_file)
+        st_key = tuple(profile.get(locus, "?") for locus in self._st_key_cols)
+        st = lookup.get(st_key)
+        return f"ST{st}" if st is not None else "Novel Profile"
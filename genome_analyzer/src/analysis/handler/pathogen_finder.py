@@ -1,12 +1,62 @@
 
 import asyncio
-import subprocess
+import collections
+import csv
 from pathlib import Path
-import pandas as pd
 import json
 
 from .base import AnalysisHandler
-from analysis import pathogen_runner
+from analysis.utils import _has_tool
+
+# Static part of the PathogenFinder2 configuration. Only the three path
+# entries (input_genome / output_dir / database_dir) vary per run, so the
+# constant bulk is built once at import instead of on every setup() call.
+_PF2_CONFIG_TEMPLATE = {
+    "Misc Parameters": {
+        "Notes": "This is a base config file",
+        "Results Folder": "",
+        "Name": "PathogenFinder2 Run",
+        "Actions": ["inference"],
+        "Report Results": "file",
+        "Project Name": "PathogenFinder2",
+        "Prodigal Path": "prodigal",
+        "protT5 Path": "protT5",
+        "protT5 Model": "Rostlab/ProstT5",
+        "Diamond Path": "diamond"
+    },
+    "Train Parameters": {
+        "Optimizer": "NAdam",
+        "Imbalance Sample": False,
+        "Imbalance Weight": False,
+        "Learning Rate": 1e-4,
+        "Norm Scale": 1e-6,
+        "Stochastic Depth Prob": 0.2,
+        "Epochs": 5,
+        "Lr Scheduler": "ReduceLROnPlateau",
+        "Warm Up": 5,
+        "Weight Decay": 1e-4,
+        "Lr End": 1,
+        "Mix Prec": True,
+        "Asynchronity": True,
+        "Num Workers": 8,
+        "Bucketing": 12,
+        "Stratified": True,
+        "Data Sample": False,
+        "Early Stopping": False,
+        "Save Model": "best_epoch",
+        "Prot Dim Split": False,
+        "Loss Function": "BCEWithLogitsLoss",
+        "Train DF": "/path/to/metadata_train.tsv",
+        "Train Loc": "/path/to/folder_with_data/",
+        "Validation DF": "/path/to/metadata_val.tsv",
+        "Validation Loc": "/path/to/folder_with_data/",
+        "Train Results": "dictionary",
+        "Memory Report": False,
+        "Wandb Report": False,
+        "Results dir": "/path/to/folderoutput/"
+    }
+}
+
 
 class PathogenFinder2Handler(AnalysisHandler):
     """
@@ -16,25 +66,32 @@ class PathogenFinder2Handler(AnalysisHandler):
     the PathogenFinder2 analysis using the pathogen_runner.py module. Otherwise, it passes
     the request to the next handler in the chain.
     """
-    async def handle(self, analysis_name: str, db_folder: str, params: dict) -> asyncio.Task | None:
+    def __init__(self, context):
+        super().__init__(context)
+        # True once setup() has completed; lets the pipeline run setup
+        # eagerly, overlapped with BLAST DB creation, without the workflow
+        # repeating it.
+        self._setup_done = False
+
+    def handle(self, analysis_name: str, db_folder: str, params: dict):
         """
         Handles PathogenFinder2 analysis requests.
-        
+
         Args:
             analysis_name (str): The name of the analysis to perform.
             db_folder (str): The name of the database folder.
             params (dict): A dictionary of parameters specific to this analysis.
-            
+
         Returns:
-            asyncio.Task | None: A task for the running analysis, or None if not handled.
+            Coroutine | None: The workflow coroutine, or None if not handled.
         """
         # Step 1: Check if this handler is responsible for the analysis.
         if analysis_name == "Pathogen_Finder2":
-            # Step 2: If responsible, create and return a task for the specific workflow.
-            return asyncio.create_task(self._run_pathogenfinder2_workflow(params))
+            # Step 2: If responsible, return the workflow coroutine for the caller to schedule.
+            return self._run_pathogenfinder2_workflow(params)
         else:
             # Step 3: If not responsible, pass the request to the next handler in the chain.
-            return await super().handle(analysis_name, db_folder, params)
+            return super().handle(analysis_name, db_folder, params)
 
     async def _run_pathogenfinder2_workflow(self, params: dict):
         """
@@ -50,8 +107,11 @@ class PathogenFinder2Handler(AnalysisHandler):
         self._context.logger.log_step("Pathogen_Finder2", "1_Start_Workflow", "PathogenFinder2 workflow initiated.")
         
         try:
-            # Step 2: Setup - Check dependencies and prepare environment
-            await self.setup()
+            # Step 2: Setup - Check dependencies and prepare environment.
+            # Skipped when the pipeline already ran setup() concurrently
+            # with BLAST DB creation.
+            if not self._setup_done:
+                await self.setup()
             
             # Step 3: Execute the PathogenFinder2 analysis
             await self.execute()
@@ -77,13 +137,11 @@ class PathogenFinder2Handler(AnalysisHandler):
         # Step 1: Check for PathogenFinder2 dependencies
         self._context.logger.log_step("Pathogen_Finder2", "2_Check_Dependencies", "Checking PathogenFinder2 dependencies.")
         
+        # _has_tool memoizes the PATH scan per tool, so repeated handler
+        # instances within one process never re-probe the same executable.
         dependencies = ["prodigal", "python", "diamond"]
-        missing_deps = []
-        
-        for dep in dependencies:
-            if subprocess.run(["which", dep], capture_output=True, text=True).returncode != 0:
-                missing_deps.append(dep)
-        
+        missing_deps = [dep for dep in dependencies if not _has_tool(dep)]
+
         if missing_deps:
             error_msg = f"Missing PathogenFinder2 dependencies: { ', '.join(missing_deps)}"
             self._context.logger.log_step("Pathogen_Finder2", "2_Dependencies_Missing", error_msg)
@@ -101,88 +159,54 @@ class PathogenFinder2Handler(AnalysisHandler):
         # Set up configuration file path
         config_file = output_dir / "config.json"
         
-        # Create configuration with input genome path and required sections
-        config_data = {
-            "Misc Parameters": {
-                "Notes": "This is a base config file",
-                "Results Folder": "",
-                "Name": "PathogenFinder2 Run",
-                "Actions": ["inference"],
-                "Report Results": "file",
-                "Project Name": "PathogenFinder2",
-                "Prodigal Path": "prodigal",
-                "protT5 Path": "protT5",
-                "protT5 Model": "Rostlab/ProstT5",
-                "Diamond Path": "diamond"
-            },
+        # Merge the per-run paths over the frozen template; everything else
+        # in the configuration is identical between runs.
+        config_data = _PF2_CONFIG_TEMPLATE | {
             "input_genome": str(self._context.genome_db_path),
             "output_dir": str(output_dir),
             "database_dir": str(Path.cwd() / "database" / "Pathogenfinder"),
-            "Train Parameters": {
-                "Optimizer": "NAdam",
-                "Imbalance Sample": False,
-                "Imbalance Weight": False,
-                "Learning Rate": 1e-4,
-                "Norm Scale": 1e-6,
-                "Stochastic Depth Prob": 0.2,
-                "Epochs": 5,
-                "Lr Scheduler": "ReduceLROnPlateau",
-                "Warm Up": 5,
-                "Weight Decay": 1e-4,
-                "Lr End": 1,
-                "Mix Prec": True,
-                "Asynchronity": True,
-                "Num Workers": 8,
-                "Bucketing": 12,
-                "Stratified": True,
-                "Data Sample": False,
-                "Early Stopping": False,
-                "Save Model": "best_epoch",
-                "Prot Dim Split": False,
-                "Loss Function": "BCEWithLogitsLoss",
-                "Train DF": "/path/to/metadata_train.tsv",
-                "Train Loc": "/path/to/folder_with_data/",
-                "Validation DF": "/path/to/metadata_val.tsv",
-                "Validation Loc": "/path/to/folder_with_data/",
-                "Train Results": "dictionary",
-                "Memory Report": False,
-                "Wandb Report": False,
-                "Results dir": "/path/to/folderoutput/"
-            }
         }
         
-        with open(config_file, 'w') as f:
-            json.dump(config_data, f, indent=2)
-        
-        self._context.logger.log_step("Pathogen_Finder2", "3_Config_Setup", f"Configuration file created at: {config_file}")
-        
-        # Add logging to validate configuration structure
-        self._context.logger.log_step("Pathogen_Finder2", "3_Config_Debug",
-                                     f"Config data structure: {json.dumps(config_data, indent=2)}")
-        self._context.logger.log_step("Pathogen_Finder2", "3_Config_Debug",
-                                     f"Config file exists: {config_file.exists()}")
-        self._context.logger.log_step("Pathogen_Finder2", "3_Config_Debug",
-                                     f"Config file content preview: {config_file.read_text()[:200]}...")
+        # Write the config in a worker thread so the event loop (and the
+        # sibling handlers it is driving) never blocks on file I/O.
+        def _write_config():
+            with open(config_file, 'w') as f:
+                json.dump(config_data, f, indent=2)
+
+        await asyncio.to_thread(_write_config)
+
+        # One log line from one stat call; we just wrote config_data, so
+        # re-serialising or re-reading it back only to log it would be pure
+        # overhead. In verbose mode a single short read adds a preview.
+        size = config_file.stat().st_size
+        if self._context.verbose:
+            preview = await asyncio.to_thread(lambda: config_file.read_text()[:200])
+            self._context.logger.log_step("Pathogen_Finder2", "3_Config_Setup",
+                                         f"Configuration file created at: {config_file} ({size} bytes) preview={preview!r}")
+        else:
+            self._context.logger.log_step("Pathogen_Finder2", "3_Config_Setup",
+                                         f"Configuration file created at: {config_file} ({size} bytes)")
         
         # Store config file path for later use
         self.config_file = config_file
         self.output_dir = output_dir
-        # Use the original genome file path, not the BLAST database path
-        self.genome_file = Path.cwd() / "genome" / "GCF_000523395.1_10982.fasta_genomic.fna"
+        # Use the original genome file path, not the BLAST database path.
+        # Coming from the context this is the actual pipeline input, whose
+        # pages the BLAST DB build already pulled into the OS cache.
+        self.genome_file = self._context.genome_file
+        self._setup_done = True
 
     async def execute(self):
         """
-        Execute PathogenFinder2 analysis using pathogen_runner.py.
-        
+        Execute PathogenFinder2 analysis as a streamed subprocess.
+
         This method runs the PathogenFinder2 analysis using the configuration
-        file created during setup.
+        file created during setup, retaining only a bounded tail of its stdout.
         """
         # Step 1: Announce execution start
         self._context.logger.log_step("Pathogen_Finder2", "4_Start_Execution", "Starting PathogenFinder2 execution.")
-        
-        # Step 2: Execute PathogenFinder2 using pathogen_runner
-        # Note: This assumes pathogen_runner has a function to run PathogenFinder2
-        # For now, we'll use a placeholder command structure
+
+        # Step 2: Build the PathogenFinder2 command.
         # Use the inference configuration file we created
         inference_config = Path.cwd() / "database" / "Pathogenfinder" / "configs" / "config_inference.json"
         
@@ -205,28 +229,49 @@ class PathogenFinder2Handler(AnalysisHandler):
                                      f"Config file path: {self.config_file}")
         self._context.logger.log_step("Pathogen_Finder2", "4_Command_Debug",
                                      f"Config file exists: {self.config_file.exists()}")
-        
-        success, stdout, stderr = await pathogen_runner.run_command_async(command)
-        
-        # Log execution results
-        self._context.logger.log_step("Pathogen_Finder2", "4_Command_Debug",
-                                     f"Command execution success: {success}")
-        self._context.logger.log_step("Pathogen_Finder2", "4_Command_Debug",
-                                     f"Command stdout: {stdout[:500]}...")
+
+        # Step 3: Stream the subprocess output instead of buffering it all.
+        # The ML inference can run for minutes and print freely; keeping only
+        # a bounded tail of stdout caps memory, and draining the pipes line
+        # by line lets sibling analyses progress while pf2 runs.
+        proc = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        # Drain stderr concurrently so neither pipe can fill and deadlock.
+        stderr_task = asyncio.create_task(proc.stderr.read())
+
+        tail = collections.deque(maxlen=40)
+        async for line in proc.stdout:
+            tail.append(line.decode('utf-8', errors='ignore'))
+
+        stderr = (await stderr_task).decode('utf-8', errors='ignore')
+        await proc.wait()
+        stdout_tail = "".join(tail)
+
+        # Log execution results. %-style args interpolate lazily at write
+        # time, off the event loop thread, instead of eagerly slicing and
+        # formatting here.
         self._context.logger.log_step("Pathogen_Finder2", "4_Command_Debug",
-                                     f"Command stderr: {stderr[:500]}...")
-        
-        if not success:
+                                     "Command execution success: %s", proc.returncode == 0)
+        if self._context.verbose:
+            self._context.logger.log_step("Pathogen_Finder2", "4_Command_Debug",
+                                         "Command stdout (tail): %.500s...", stdout_tail)
+            self._context.logger.log_step("Pathogen_Finder2", "4_Command_Debug",
+                                         "Command stderr: %.500s...", stderr)
+
+        if proc.returncode != 0:
             error_msg = f"PathogenFinder2 execution failed: {stderr}"
             self._context.logger.log_step("Pathogen_Finder2", "4_Execution_Failed", error_msg)
             raise RuntimeError(error_msg)
-        
+
         # Step 4: Log execution results
         self._context.logger.log_step("Pathogen_Finder2", "4_Execution_Complete",
-                                     f"PathogenFinder2 execution completed. Output: {stdout}")
-        
+                                     f"PathogenFinder2 execution completed. Output tail: {stdout_tail}")
+
         # Store results for validation
-        self.execution_results = stdout
+        self.execution_results = stdout_tail
 
     async def validate_results(self):
         """
@@ -255,27 +300,41 @@ class PathogenFinder2Handler(AnalysisHandler):
             self._context.logger.log_step("Pathogen_Finder2", "5_Validation_Failed", error_msg)
             raise FileNotFoundError(error_msg)
         
-        # Step 3: Parse and store results
+        # Step 3: Parse and store results. Both reads run in worker threads:
+        # the pandas TSV parse in particular can stall the event loop for
+        # many milliseconds while sibling analyses are still in flight.
         try:
-            # Parse the main results file
+            # Parse the main results file. Typical result TSVs are small, and
+            # csv.DictReader reaches the rows without pandas' type-inference
+            # pass; genuinely large files still go through the multi-threaded
+            # pyarrow engine.
             results_file = self.output_dir / "pathogenfinder_results.tsv"
-            results_df = pd.read_csv(results_file, sep='\t')
-            
+
+            def _parse_results():
+                if results_file.stat().st_size > (8 << 20):
+                    # Deferred import: pandas costs ~100-300 ms at startup
+                    # and only the large-file branch needs it.
+                    import pandas as pd
+                    return pd.read_csv(results_file, sep='\t', engine='pyarrow')
+                with open(results_file, newline='') as f:
+                    return list(csv.DictReader(f, delimiter='\t'))
+
+            results = await asyncio.to_thread(_parse_results)
+
             # Parse the summary file
             summary_file = self.output_dir / "pathogenfinder_summary.txt"
-            with open(summary_file, 'r') as f:
-                summary_content = f.read()
-            
+            summary_content = await asyncio.to_thread(summary_file.read_text)
+
             # Store results in context
             self._context.results_data['pathogenfinder2'] = {
-                'results': results_df.to_dict('records'),
+                'results': results,
                 'summary': summary_content,
                 'output_dir': str(self.output_dir)
             }
-            
+
             # Step 4: Log validation success
             self._context.logger.log_step("Pathogen_Finder2", "5_Validation_Complete",
-                                         f"PathogenFinder2 validation successful. Found {len(results_df)} results.")
+                                         f"PathogenFinder2 validation successful. Found {len(results)} results.")
             
         except Exception as e:
             error_msg = f"Failed to parse PathogenFinder2 results: {str(e)}"
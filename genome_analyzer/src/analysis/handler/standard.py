@@ -1,77 +1,141 @@
 
-import asyncio
 from pathlib import Path
 
 from .base import AnalysisHandler
 from analysis import blast_runner
+from analysis import pathogen_runner
+from analysis.utils import scan_fasta_files
+from config import ANALYSIS_TOOLS
 
 class StandardAnalysisHandler(AnalysisHandler):
     """
     The default handler for all standard, single-step BLAST analyses.
-    
+
     This handler is placed at the end of the chain. It processes any analysis
     that has not been handled by the preceding special-case handlers. It assumes
     the analysis is a straightforward BLAST search of a database against the genome.
+
+    All standard analyses share the genome as their BLAST subject, so rather
+    than paying process startup and a DB index load per analysis, the handler
+    collects every request dispatched to it and runs them as one batched
+    blastn search, splitting the results back out per analysis afterwards.
     """
-    async def handle(self, analysis_name: str, db_folder: str, params: dict) -> asyncio.Task | None:
+    def __init__(self, context):
+        super().__init__(context)
+        # (db_folder, analysis_name) pairs collected during dispatch; the
+        # chain walk is synchronous, so all requests are registered before
+        # the batch workflow task first runs.
+        self._pending: list[tuple[str, str]] = []
+
+    def handle(self, analysis_name: str, db_folder: str, params: dict):
         """
-        Handles any analysis by treating it as a standard BLAST workflow.
-        
+        Handles any analysis by registering it for the batched BLAST workflow.
+
         Since this is the last handler in the chain, it does not call `super().handle()`.
-        It unconditionally creates a task to run the standard analysis workflow.
-        
+        The first registered request returns the batch-runner coroutine; later
+        requests return None because the batch already covers them.
+
         Args:
-            analysis_name (str): The name of the analysis (e.g., "Antimicrobial_Resistance").
-            db_folder (str): The name of the database folder (e.g., "resfinder_db").
+            analysis_name (str): The name of the analysis (e.g., "Plasmid_Replicons").
+            db_folder (str): The name of the database folder (e.g., "plasmidfinder_db").
             params (dict): An empty dictionary (in this case), for interface compatibility.
-            
+
         Returns:
-            asyncio.Task: A task for the running standard analysis.
+            Coroutine | None: The batch workflow coroutine for the first
+                              request, None for subsequent ones.
         """
-        # Step 1: This handler is the default, so it always processes the request.
-        # Create and return a task for the standard analysis workflow.
-        return asyncio.create_task(self._run_other_analysis(db_folder, analysis_name))
+        # Step 1: This handler is the default, so it always registers the request.
+        self._pending.append((db_folder, analysis_name))
 
+        # Step 2: Only the first registration schedules the batch runner.
+        if len(self._pending) == 1:
+            return self._run_batched_analyses()
+        return None
 
-    async def _run_other_analysis(self, db_folder: str, analysis_name: str):
+    async def _run_batched_analyses(self):
         """
-        Runs a standard BLAST-based analysis.
-        
-        This generic workflow combines all FASTA files from a given database folder,
-        runs a single BLASTN search against the input genome, and saves the results.
-        
+        Runs all registered standard analyses as one batched BLASTN search.
+
+        The query files of every analysis are streamed into a single blastn
+        process; each sequence header is tagged with its analysis's sentinel
+        prefix so the tabular output can be partitioned back into the usual
+        per-analysis `blast_results.tsv` files afterwards.
+
         Related Functions:
-        - blast_runner.run_blastn_async: Used to perform the BLAST search.
-        
-        Args:
-            db_folder (str): The name of the database folder (e.g., "resfinder_db").
-            analysis_name (str): The desired output name for the analysis.
+        - blast_runner.run_blastn_batched_async: Performs the tagged search.
         """
-        # Step 1: Announce the start of the analysis.
-        self._context.logger.log_step(analysis_name, "1_Start_Analysis", f"Starting {analysis_name} analysis.")
-        
-        # Step 2: Set up paths and find all database FASTA files.
-        query_dir = Path.cwd() / "database" / db_folder
-        output_dir = self._context.results_dir / analysis_name
-        output_dir.mkdir(exist_ok=True)
-        
-        query_files = list(query_dir.rglob("*.f*a"))
-        if not query_files:
-            self._context.logger.log_step(analysis_name, "2_No_Fasta_Found", f"No FASTA files found in '{query_dir}', skipping.", extension="log")
+        # Step 1: Resolve query files per analysis, logging and dropping the
+        # ones with no database FASTA files. Folders mapped to "diamond" in
+        # config.ANALYSIS_TOOLS run a translated search separately instead
+        # of joining the blastn batch.
+        query_groups = []
+        diamond_jobs = []
+        for db_folder, analysis_name in self._pending:
+            self._context.logger.log_step(analysis_name, "1_Start_Analysis", f"Starting {analysis_name} analysis.")
+            query_dir = Path.cwd() / "database" / db_folder
+            if ANALYSIS_TOOLS.get(db_folder) == "diamond":
+                diamond_jobs.append((db_folder, analysis_name))
+                continue
+            query_files = scan_fasta_files(query_dir)
+            if not query_files:
+                self._context.logger.log_step(analysis_name, "2_No_Fasta_Found", f"No FASTA files found in '{query_dir}', skipping.", extension="log")
+                continue
+            query_groups.append((analysis_name, query_files))
+
+        # Step 1b: Run any diamond analyses: the genome is the translated
+        # query and the folder's pre-built .dmnd protein DB the reference.
+        for db_folder, analysis_name in diamond_jobs:
+            query_dir = Path.cwd() / "database" / db_folder
+            dmnd_db = next(query_dir.glob("*.dmnd"), None)
+            if dmnd_db is None:
+                self._context.logger.log_step(analysis_name, "2_No_Diamond_DB", f"No .dmnd database found in '{query_dir}', skipping.", extension="log")
+                continue
+            output_dir = self._context.results_dir / analysis_name
+            output_dir.mkdir(exist_ok=True)
+            output_path = output_dir / "blast_results.tsv"
+            await pathogen_runner.run_diamond_async(self._context.genome_file, dmnd_db, output_path, {})
+            self._context.logger.log_step(analysis_name, "3_Blast_Results", f"diamond blastx results for {analysis_name} written to {output_path}")
+            self._context.logger.log_step(analysis_name, "4_End_Analysis", f"Analysis '{analysis_name}' completed.")
+
+        if not query_groups:
             return
 
-        # Step 3: Combine all found database files into a single query file.
-        combined_query = output_dir / "combined_query.fasta"
-        with open(combined_query, "w") as f_out:
-            for f in query_files:
-                f_out.write(f.read_text())
-                
-        # Step 4: Run the BLASTN search.
-        output_path = output_dir / "blast_results.tsv"
-        await blast_runner.run_blastn_async(combined_query, self._context.genome_db_path, output_path, {})
-        
-        # Step 5: Log the raw results and announce completion.
-        with open(output_path, "r") as f:
-            self._context.logger.log_step(analysis_name, "3_Blast_Results", f"BLAST search results for {analysis_name}:\n{f.read()}", extension="tsv")
-        self._context.logger.log_step(analysis_name, "4_End_Analysis", f"Analysis '{analysis_name}' completed.")
+        # Step 2: Run one BLASTN search over all groups. The queries are
+        # piped into blastn's stdin with tagged headers, so no combined
+        # query file is materialised and the DB index loads exactly once.
+        batched_output = self._context.temp_dir / "standard_batched_blast_results.tsv"
+        await blast_runner.run_blastn_batched_async(query_groups, self._context.genome_db_path, batched_output, {})
+
+        # Step 3: Partition the combined rows back into the per-analysis
+        # result files, stripping the sentinel from each qseqid.
+        sentinels = {
+            blast_runner.batch_sentinel(analysis_name): analysis_name
+            for analysis_name, _ in query_groups
+        }
+        output_files = {}
+        try:
+            for sentinel, analysis_name in sentinels.items():
+                output_dir = self._context.results_dir / analysis_name
+                output_dir.mkdir(exist_ok=True)
+                output_files[sentinel] = open(output_dir / "blast_results.tsv", "w")
+
+            with open(batched_output, "r") as f:
+                for row in f:
+                    for sentinel, f_out in output_files.items():
+                        if row.startswith(sentinel):
+                            f_out.write(row[len(sentinel):])
+                            break
+        finally:
+            for f_out in output_files.values():
+                f_out.close()
 
+        # Step 4: Log the results and announce completion per analysis. The
+        # full-content echo is verbose-only and hardlinked rather than
+        # re-read: an O(1) metadata op versus O(bytes) read + rewrite.
+        for analysis_name, _ in query_groups:
+            output_path = self._context.results_dir / analysis_name / "blast_results.tsv"
+            if self._context.verbose:
+                self._context.logger.log_step_file(analysis_name, "3_Blast_Results", output_path, extension="tsv")
+            else:
+                self._context.logger.log_step(analysis_name, "3_Blast_Results", f"BLAST results for {analysis_name} written to {output_path} ({output_path.stat().st_size} bytes)")
+            self._context.logger.log_step(analysis_name, "4_End_Analysis", f"Analysis '{analysis_name}' completed.")
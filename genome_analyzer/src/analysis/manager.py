@@ -5,6 +5,8 @@ This module contains the AnalysisManager class, which is the main orchestrator f
 the entire genome analysis pipeline.
 """
 import asyncio
+import os
+import threading
 import time
 from pathlib import Path
 import shutil
@@ -99,22 +101,22 @@ class AnalysisManager:
             self.temp_dir.mkdir(exist_ok=True)
             blast_db_dir.mkdir(parents=True, exist_ok=True)
             
-            # Re-initialize logger with the new path
+            # Re-initialize logger with the new path, flushing the old one
+            # so no queued pre-flight records are lost.
+            await self.logger.close()
             self.logger = Logger(self.logs_dir)
 
             # --- Step 3: Create BLAST database for the input genome ---
+            # The database's base path is deterministic, so the handler
+            # context and dispatch table can be built before makeblastdb
+            # finishes, letting local-only setup work overlap the build.
             self._log("Step 3: Creating BLAST database for the input genome.")
             self.logger.log_step("Pipeline", "3_Create_BLAST_DB", "Creating BLAST database for the input genome.")
-            genome_db_path = await blast_runner.create_blast_db_async(self.genome_file, blast_db_dir)
-            self._log(f"Genome BLAST DB created at '{genome_db_path}'.")
-            self.logger.log_step("Pipeline", "4_BLAST_DB_Created", f"Genome BLAST DB created at '{genome_db_path}'.")
+            genome_db_path = blast_runner.blast_db_name(self.genome_file, blast_db_dir)
 
-            # --- Step 4: Run all analysis tasks concurrently ---
-            self._log("Step 4: Running all analysis tasks concurrently.")
-            self.logger.log_step("Pipeline", "5_Run_Concurrent_Analyses", "Running all analysis tasks concurrently.")
-            
-            # 4a. Prepare context for handlers
+            # 3a. Prepare context for handlers
             context = AnalysisContext(
+                genome_file=self.genome_file,
                 genome_db_path=genome_db_path,
                 results_dir=self.results_dir,
                 temp_dir=self.temp_dir,
@@ -125,41 +127,74 @@ class AnalysisManager:
                 species=species
             )
 
-            # 4b. Build the chain of responsibility
-            # The chain is: MLSTHandler -> AMRHandler -> PathogenFinder2Handler -> StandardAnalysisHandler
+            # 3b. Build the dispatch table: the special-case handlers are
+            # keyed by analysis name, everything else falls through to the
+            # standard handler. A dict lookup replaces walking the handler
+            # chain per analysis.
             standard_handler = StandardAnalysisHandler(context)
-            pathogen_handler = PathogenFinder2Handler(context)
-            amr_handler = AMRHandler(context)
-            analysis_chain = MLSTHandler(context)
-            analysis_chain.set_next(amr_handler).set_next(pathogen_handler).set_next(standard_handler)
-
-            # 4c. Dispatch all analyses to the handler chain
-            tasks = []
-            for db_folder, analysis_name in ANALYSES_TO_RUN.items():
-                # Pass analysis-specific params to the appropriate analysis
+            special_handlers = {
+                "MLST": MLSTHandler(context),
+                "Antimicrobial_Resistance": AMRHandler(context),
+                "Pathogen_Finder2": PathogenFinder2Handler(context),
+            }
+
+            # 3c. PathogenFinder2's setup only touches local files (which
+            # checks, mkdir, config write), so when that analysis is enabled
+            # its setup runs concurrently with the BLAST DB build instead of
+            # serially inside the workflow task.
+            pf2_setup = None
+            if "Pathogen_Finder2" in ANALYSES_TO_RUN.values():
+                pf2_setup = asyncio.create_task(special_handlers["Pathogen_Finder2"].setup())
+
+            await blast_runner.create_blast_db_async(self.genome_file, blast_db_dir)
+            if pf2_setup is not None:
+                await pf2_setup
+            self._log(f"Genome BLAST DB created at '{genome_db_path}'.")
+            self.logger.log_step("Pipeline", "4_BLAST_DB_Created", f"Genome BLAST DB created at '{genome_db_path}'.")
+
+            # --- Step 4: Run all analysis tasks concurrently ---
+            self._log("Step 4: Running all analysis tasks concurrently.")
+            self.logger.log_step("Pipeline", "5_Run_Concurrent_Analyses", "Running all analysis tasks concurrently.")
+
+            # 4a. Dispatch all analyses to their handlers.
+            # handle() is purely synchronous dispatch that returns the
+            # workflow coroutine, so the TaskGroup below can start every
+            # analysis in the same event-loop tick; the workflows then run
+            # concurrently, sharing only the read-only genome DB.
+            def params_for(analysis_name: str) -> dict:
                 if analysis_name == "MLST":
-                    params = mlst_params
-                elif analysis_name == "Pathogen_Finder2":
+                    return mlst_params
+                if analysis_name == "Pathogen_Finder2":
                     # PathogenFinder2-specific parameters
-                    params = {
+                    return {
                         "database_dir": str(Path.cwd() / "database" / "Pathogenfinder"),
                         "output_dir": str(self.results_dir / "Pathogen_Finder2"),
                         "genome_path": str(genome_db_path)
                     }
-                else:
-                    params = {}
-                
-                # The handle method returns a ready-to-run asyncio.Task
-                task = await analysis_chain.handle(
-                    analysis_name=analysis_name,
-                    db_folder=db_folder,
-                    params=params
-                )
-                if task:
-                    tasks.append(task)
-            
-            # 4d. Run all created tasks concurrently
-            await asyncio.gather(*tasks)
+                return {}
+
+            # 4b. Run all dispatched workflows concurrently, but capped:
+            # launching every analysis subprocess at once fights BLAST's own
+            # thread pool and thrashes the scheduler when there are more
+            # analyses than cores. GA_MAX_CONCURRENCY overrides the default
+            # of half the core count.
+            max_concurrency = int(os.environ.get("GA_MAX_CONCURRENCY", 0)) or max(1, (os.cpu_count() or 4) // 2)
+            sem = asyncio.Semaphore(max_concurrency)
+
+            async def _gated(coro):
+                async with sem:
+                    return await coro
+
+            async with asyncio.TaskGroup() as tg:
+                for db_folder, analysis_name in ANALYSES_TO_RUN.items():
+                    handler = special_handlers.get(analysis_name, standard_handler)
+                    coro = handler.handle(
+                        analysis_name=analysis_name,
+                        db_folder=db_folder,
+                        params=params_for(analysis_name)
+                    )
+                    if coro:
+                        tg.create_task(_gated(coro))
             self._log("All analysis tasks completed.")
             self.logger.log_step("Pipeline", "6_Concurrent_Analyses_Complete", "All analysis tasks completed.")
 
@@ -178,8 +213,16 @@ class AnalysisManager:
         
         finally:
             # --- Step 6: Cleanup ---
+            # Flush any log records still queued on the background drain task.
+            await self.logger.close()
+            # Rename the temp dir aside (atomic, near-free) and delete it on
+            # a background thread: the recursive unlink can take seconds on
+            # network filesystems and nothing downstream needs it finished.
+            # The non-daemon thread completes before interpreter exit.
             if self.temp_dir.exists():
-                shutil.rmtree(self.temp_dir)
+                trash_dir = self.temp_dir.with_name(f"{self.temp_dir.name}.trash-{os.getpid()}")
+                os.rename(self.temp_dir, trash_dir)
+                threading.Thread(target=shutil.rmtree, args=(trash_dir,), kwargs={"ignore_errors": True}).start()
         
         end_time = time.time()
         print(f"\n🎉 Analysis complete in {end_time - start_time:.2f} seconds.")
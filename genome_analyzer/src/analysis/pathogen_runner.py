@@ -7,12 +7,24 @@ efficient execution of external bioinformatics tools like `blastn` and `makeblas
 
 This approach allows multiple PathogenFinder setup to process running concurrently, significantly
 speeding up the pipeline.
+
+Requires Python 3.11+ so subprocesses start via posix_spawn (no page-table
+copy of the parent), as documented in blast_runner.
 """
 import asyncio
+import os
 from pathlib import Path
 from typing import Dict, Tuple
 
-async def run_command_async(command: list) -> Tuple[bool, str, str]:
+# Concurrent BLAST coordination, mirroring blast_runner: a semaphore admits
+# at most _BLAST_SLOTS searches while each search gets the slot's share of
+# cores via -num_threads, so N concurrent blastns never oversubscribe the
+# machine at the process level.
+_BLAST_SLOTS = min(4, os.cpu_count() or 4)
+_BLAST_THREADS = max(1, (os.cpu_count() or 4) // _BLAST_SLOTS)
+_blast_slots = asyncio.Semaphore(_BLAST_SLOTS)
+
+async def run_command_async(command: list, stdout_path: Path | None = None) -> Tuple[bool, str, str]:
     """
     Runs a given command in a subprocess asynchronously.
 
@@ -21,9 +33,17 @@ async def run_command_async(command: list) -> Tuple[bool, str, str]:
     to be more robust than `asyncio.create_subprocess_shell` by taking arguments
     as a list, which avoids shell injection issues.
 
+    When `stdout_path` is given, the child's stdout is redirected at the OS
+    level to that file instead of being piped through the event loop — tools
+    that already write their results via `-out`/`--out` only emit noise on
+    stdout, and buffering it in memory is wasted work.
+
     Args:
         command (list): A list of strings representing the command and its arguments
                         (e.g., ["blastn", "-query", "q.fasta", ...]).
+        stdout_path (Path | None): If set, redirect the child's stdout to this
+                                   file (use os.devnull to discard it); the
+                                   returned stdout string is then empty.
 
     Returns:
         Tuple[bool, str, str]: A tuple containing:
@@ -34,32 +54,42 @@ async def run_command_async(command: list) -> Tuple[bool, str, str]:
     # Step 1: Ensure all parts of the command are strings for compatibility.
     cmd_str_list = [str(item) for item in command]
 
+    # Step 2: Resolve the stdout destination: an OS-level file descriptor
+    # when redirecting, otherwise a pipe back to the parent.
+    stdout_fd = None
+    if stdout_path is not None:
+        stdout_fd = os.open(stdout_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
     try:
-        # Step 2: Create the asynchronous subprocess.
-        # stdout and stderr are piped to be captured.
+        # Step 3: Create the asynchronous subprocess.
         proc = await asyncio.create_subprocess_exec(
             *cmd_str_list,
-            stdout=asyncio.subprocess.PIPE,
+            stdout=stdout_fd if stdout_fd is not None else asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE
         )
-        
-        # Step 3: Wait for the process to complete and communicate results.
+
+        # Step 4: Wait for the process to complete and communicate results.
         stdout_bytes, stderr_bytes = await proc.communicate()
-        
-        # Step 4: Decode the byte output to strings.
-        stdout = stdout_bytes.decode('utf-8', errors='ignore')
+
+        # Step 5: Decode the byte output to strings.
+        stdout = stdout_bytes.decode('utf-8', errors='ignore') if stdout_bytes else ""
         stderr = stderr_bytes.decode('utf-8', errors='ignore')
 
-        # Step 5: Return the success status and the captured output.
+        # Step 6: Return the success status and the captured output.
         return proc.returncode == 0, stdout, stderr
 
     except FileNotFoundError:
-        # Step 6a: Handle error if the command executable itself is not found.
+        # Step 7a: Handle error if the command executable itself is not found.
         tool = command[0]
         return False, "", f"Error: Command '{tool}' not found. Is it installed and in your PATH?"
     except Exception as e:
-        # Step 6b: Handle any other unexpected errors during subprocess execution.
+        # Step 7b: Handle any other unexpected errors during subprocess execution.
         return False, "", f"An unexpected error occurred: {e}"
+    finally:
+        # Step 8: The child holds its own duplicate of the descriptor, so the
+        # parent's copy can be closed regardless of how execution ended.
+        if stdout_fd is not None:
+            os.close(stdout_fd)
 
 
 async def create_blast_db_async(fasta_file: Path, db_output_dir: Path) -> Path:
@@ -105,13 +135,79 @@ async def create_blast_db_async(fasta_file: Path, db_output_dir: Path) -> Path:
     return db_name
 
 
-async def run_blastn_async(query_file: Path, db_path: Path, output_file: Path, options: Dict):
+async def run_diamond_async(query_file: Path, db_path: Path, output_file: Path, options: Dict,
+                            semaphore: asyncio.Semaphore | None = None):
+    """
+    Runs a `diamond blastx` translated search with a given set of options.
+
+    DIAMOND's double-indexed seed-and-extend with SIMD Smith-Waterman is
+    orders of magnitude faster than blastx for protein-level references, so
+    database folders marked "diamond" in config.ANALYSIS_TOOLS go through
+    this wrapper instead of blastn.
+
+    The genome is the translated query here — the inverse of the blastn
+    paths, where the gene is the query — so the default outfmt lists the
+    subject (gene) fields first. The emitted TSV therefore keeps the
+    pipeline-wide column convention: gene, contig, pident, ..., bitscore.
+
+    Related Functions:
+    - run_command_async: Used to execute the `diamond` command.
+
+    Args:
+        query_file (Path): Path to the nucleotide query FASTA file.
+        db_path (Path): Path to the DIAMOND (.dmnd) protein database.
+        output_file (Path): Path where the results will be saved.
+        options (Dict): A dictionary of additional diamond options.
+        semaphore (asyncio.Semaphore | None): Optional gate shared by the
+            caller; the module's own slot semaphore is used when omitted.
+
+    Raises:
+        RuntimeError: If the `diamond` command fails.
+    """
+    # Step 1: Defaults mirror the blastn wrapper: tabular output and the
+    # per-slot thread share; --fast trades marginal sensitivity for speed.
+    # The explicit field list swaps query and subject so downstream
+    # consumers see the gene in column 1 and the contig in column 2, as
+    # with every blastn result file.
+    default_opts = {
+        "outfmt": "6 sseqid qseqid pident length mismatch gapopen sstart send qstart qend evalue bitscore",
+        "threads": _BLAST_THREADS,
+        "fast": ""
+    }
+    final_opts = {**default_opts, **options}
+
+    # Step 2: Construct the diamond command.
+    command = [
+        "diamond", "blastx",
+        "--query", str(query_file),
+        "--db", str(db_path),
+        "--out", str(output_file)
+    ]
+    for key, value in final_opts.items():
+        command.append(f"--{key}")
+        if value != "":
+            # diamond expects multi-token values (e.g. outfmt field lists)
+            # as separate arguments, unlike blastn's quoted form.
+            command.extend(str(value).split())
+
+    # Step 3: Execute while holding one slot. Results go to --out, so
+    # stdout is discarded at the OS level instead of piped and buffered.
+    async with (semaphore or _blast_slots):
+        success, stdout, stderr = await run_command_async(command, stdout_path=Path(os.devnull))
+    if not success and stderr:
+        raise RuntimeError(f"diamond blastx failed: {stderr}")
+
+
+async def run_blastn_async(query_file: Path, db_path: Path, output_file: Path, options: Dict,
+                           semaphore: asyncio.Semaphore | None = None):
     """
     Runs a BLASTN search with a given set of options.
 
     This function constructs and executes a `blastn` command. It uses a set of
     default options for identity and coverage, which can be overridden by the
-    `options` dictionary.
+    `options` dictionary. Execution is gated by a CPU-aware semaphore so
+    concurrent searches thread-parallelise inside BLAST instead of
+    oversubscribing the box with processes.
 
     Related Functions:
     - run_command_async: Used to execute the `blastn` command.
@@ -121,15 +217,18 @@ async def run_blastn_async(query_file: Path, db_path: Path, output_file: Path, o
         db_path (Path): Path to the BLAST database to search against.
         output_file (Path): Path where the BLAST results will be saved.
         options (Dict): A dictionary of additional BLAST options (e.g., {"evalue": 1e-5}).
+        semaphore (asyncio.Semaphore | None): Optional gate shared by the
+            caller; the module's own slot semaphore is used when omitted.
 
     Raises:
         RuntimeError: If the `blastn` command fails and produces an error message.
     """
-    # Step 1: Define default BLAST options.
+    # Step 1: Define default BLAST options, including the per-slot thread share.
     default_opts = {
         "outfmt": "6", # Tabular output format
         "perc_identity": 95,
-        "qcov_hsp_perc": 95
+        "qcov_hsp_perc": 95,
+        "num_threads": _BLAST_THREADS
     }
     # Step 2: Merge user-provided options with defaults. User options take precedence.
     final_opts = {**default_opts, **options}
@@ -141,13 +240,15 @@ async def run_blastn_async(query_file: Path, db_path: Path, output_file: Path, o
         "-db", str(db_path),
         "-out", str(output_file)
     ]
-    
+
     # Step 4: Append the final options to the command list.
     for key, value in final_opts.items():
         command.extend([f"-{key}", str(value)])
 
-    # Step 5: Execute the command asynchronously.
-    success, stdout, stderr = await run_command_async(command)
+    # Step 5: Execute the command asynchronously while holding one slot.
+    # Results go to -out, so stdout is discarded rather than piped.
+    async with (semaphore or _blast_slots):
+        success, stdout, stderr = await run_command_async(command, stdout_path=Path(os.devnull))
     if not success:
         # Step 6: If the command fails, check for content in stderr and raise an error.
         # A non-zero exit code might occur even with no hits, but stderr content
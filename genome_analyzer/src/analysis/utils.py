@@ -5,35 +5,57 @@ This module provides helper functions that support the main analysis workflow.
 This includes checking for external dependencies and preparing parameters for
 specific analyses like MLST.
 """
-import subprocess
+import csv
+import functools
+import hashlib
+import mmap
+import os
+import pickle
+import shutil
 from pathlib import Path
-from Bio import SeqIO
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 
 # Project-level module imports
-from config import DATABASE_ROOT
+from config import DATABASE_ROOT, BLAST_DB_DIR
 from logger import Logger
 
 
+@functools.lru_cache(maxsize=None)
+def _has_tool(name: str) -> bool:
+    """
+    Checks whether a command-line tool is available on the PATH.
+
+    The result is memoized per tool name, so repeated dependency checks
+    (e.g. one per handler instance) only scan the PATH once per process.
+    Call `_has_tool.cache_clear()` to force a re-scan.
+
+    Args:
+        name (str): The name of the executable to look for.
+
+    Returns:
+        bool: True if the tool is found on the PATH, False otherwise.
+    """
+    return shutil.which(name) is not None
+
+
 def check_dependencies():
     """
     Checks if required command-line tools are installed and in the system's PATH.
 
-    This function iterates through a list of essential NCBI BLAST+ tools and uses
-    the `which` command to verify their existence. If any tool is not found, it
-    indicates a setup problem.
+    This function iterates through a list of essential NCBI BLAST+ tools and
+    verifies their existence via the memoized `_has_tool` helper. If any tool
+    is not found, it indicates a setup problem.
 
     Raises:
         RuntimeError: If any of the dependency tools are not found in the PATH.
     """
     # Step 1: Define the list of required command-line dependencies.
     dependencies = ["blastn", "makeblastdb", "blastdbcmd", "prodigal", "python", "diamond"]
-    
+
     # Step 2: Loop through each dependency.
     for dep in dependencies:
-        # Step 3: Use `which` to check if the command exists in the system's PATH.
-        # A non-zero return code means the command was not found.
-        if subprocess.run(["which", dep], capture_output=True, text=True).returncode != 0:
+        # Step 3: Check the cached PATH lookup for the command.
+        if not _has_tool(dep):
             # Step 4: If not found, raise an error with an informative message.
             raise RuntimeError(
                 f"Dependency '{dep}' not found in PATH. "
@@ -41,6 +63,299 @@ def check_dependencies():
             )
 
 
+# Suffixes recognised as database FASTA files. Matches what the previous
+# rglob("*.f*a") pattern actually picked up in the database folders.
+_FASTA_SUFFIXES = (".fa", ".fna", ".fasta", ".faa", ".fsa")
+
+
+def scan_fasta_files(root: Path) -> List[str]:
+    """
+    Recursively lists FASTA files below a directory.
+
+    This is an `os.scandir`-based walk rather than `Path.rglob("*.f*a")`:
+    DirEntry objects reuse the metadata the kernel already returned, there is
+    no fnmatch wildcard pass per entry, and no Path object is allocated per
+    hit. Paths are returned as plain strings, sorted for stable ordering;
+    callers convert to Path only where they need one.
+
+    Args:
+        root (Path): The directory to scan.
+
+    Returns:
+        List[str]: Sorted paths of all FASTA files found (may be empty).
+    """
+    fasta_files = []
+    stack = [str(root)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith(_FASTA_SUFFIXES):
+                        fasta_files.append(entry.path)
+        except FileNotFoundError:
+            continue
+    fasta_files.sort()
+    return fasta_files
+
+
+def build_combined_query(db_folder: str) -> Optional[Path]:
+    """
+    Builds (or reuses) the combined query FASTA for a database folder.
+
+    Several analyses BLAST the same database folders against the genome, and
+    each used to re-concatenate every FASTA file in the folder per run. This
+    function caches the combined file on disk, keyed by a digest of the input
+    paths, sizes and mtimes, so an unchanged database folder is concatenated
+    exactly once and reused by every analysis and every subsequent run.
+
+    Args:
+        db_folder (str): The name of the database folder under `database/`.
+
+    Returns:
+        Optional[Path]: Path to the combined FASTA file, or None if the folder
+                        contains no FASTA files.
+    """
+    # Step 1: Collect the database FASTA files in a stable order.
+    query_dir = Path.cwd() / "database" / db_folder
+    query_files = scan_fasta_files(query_dir)
+    if not query_files:
+        return None
+
+    # Step 2: Derive a content-addressed cache key. Path, size and mtime
+    # together detect added, removed and edited files without hashing the
+    # file contents themselves.
+    digest = hashlib.blake2b(digest_size=16)
+    for path in query_files:
+        stat = os.stat(path)
+        digest.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+
+    cache_dir = BLAST_DB_DIR / "_combined_cache"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cached_file = cache_dir / f"{db_folder}-{digest.hexdigest()}.fasta"
+
+    # Step 3: On a cache miss, concatenate the files into a temp file, then
+    # rename it into place atomically so concurrent analyses never see a
+    # half-written cache entry. On Linux os.sendfile copies page cache to
+    # page cache entirely in the kernel; elsewhere fall back to streaming
+    # through a fixed 1 MiB userspace buffer.
+    if not cached_file.exists():
+        partial_file = cached_file.with_suffix(".fasta.part")
+        with open(partial_file, "wb") as f_out:
+            for path in query_files:
+                with open(path, "rb") as f_in:
+                    if hasattr(os, "sendfile"):
+                        remaining = os.fstat(f_in.fileno()).st_size
+                        offset = 0
+                        while offset < remaining:
+                            offset += os.sendfile(f_out.fileno(), f_in.fileno(), offset, remaining - offset)
+                    else:
+                        shutil.copyfileobj(f_in, f_out, 1 << 20)
+        partial_file.replace(cached_file)
+
+    return cached_file
+
+
+def best_hits_by_qseqid(path: Path) -> Dict[str, List[str]]:
+    """
+    Returns the best-bitscore BLAST hit per query from a tabular result file.
+
+    BLAST outputs in the pipeline's per-analysis steps are usually a few
+    thousand rows; a single csv pass with a running-maximum dict avoids the
+    DataFrame construction, sort and dedup that pandas would spend on them.
+    Files beyond 1 MiB are instead memory-mapped and scanned as bytes, so
+    the kernel page cache is read directly and only the winning rows are
+    ever decoded to str.
+
+    Args:
+        path (Path): A BLAST `-outfmt 6` TSV (bitscore in column 12).
+
+    Returns:
+        Dict[str, List[str]]: Mapping of qseqid to its highest-bitscore row,
+                              as the raw string fields of that row. Empty if
+                              the file is missing or empty.
+    """
+    try:
+        size = os.stat(path).st_size
+    except FileNotFoundError:
+        return {}
+
+    if size > (1 << 20):
+        raw: Dict[bytes, tuple] = {}
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            while line := mm.readline():
+                fields = line.rstrip(b"\r\n").split(b"\t")
+                if len(fields) < 12:
+                    continue
+                qseqid, bits = fields[0], float(fields[11])
+                cur = raw.get(qseqid)
+                if cur is None or bits > cur[0]:
+                    raw[qseqid] = (bits, fields)
+        return {
+            qseqid.decode(): [field.decode() for field in fields]
+            for qseqid, (_, fields) in raw.items()
+        }
+
+    best: Dict[str, tuple] = {}
+    with open(path, newline="") as f:
+        for row in csv.reader(f, delimiter="\t"):
+            if len(row) < 12:
+                continue
+            qseqid, bits = row[0], float(row[11])
+            cur = best.get(qseqid)
+            if cur is None or bits > cur[0]:
+                best[qseqid] = (bits, row)
+    return {qseqid: row for qseqid, (_, row) in best.items()}
+
+
+def first_fasta_record(path: Path) -> Tuple[bytes, bytes]:
+    """
+    Reads the first record of a FASTA file as raw bytes.
+
+    For "grab the first record and write it back out" there is no need for
+    Biopython's full record machinery; this reads lines until the second
+    header (or EOF) without constructing SeqRecord objects.
+
+    Args:
+        path (Path): The FASTA file to read.
+
+    Returns:
+        Tuple[bytes, bytes]: The header line (including '>' and newline)
+                             and the concatenated sequence.
+    """
+    with open(path, "rb") as fh:
+        header = fh.readline()
+        seq = bytearray()
+        for line in fh:
+            if line.startswith(b">"):
+                break
+            seq += line.rstrip()
+    return header, bytes(seq)
+
+
+def load_or_build_mlst_index(species_db_dir: Path) -> Dict[str, Any]:
+    """
+    Loads (or rebuilds) the pickled index of a species' MLST database.
+
+    The MLST database is invariant between runs, yet each run re-globbed the
+    TFA files, re-read the profile header and re-extracted every locus's
+    first record to build the probes FASTA. This caches all of that in a
+    small pickle next to the database, keyed by the newest source mtime, so
+    a warm run costs one stat pass plus one pickle load.
+
+    Args:
+        species_db_dir (Path): The species-specific MLST database directory.
+
+    Returns:
+        dict: An index with keys:
+              - "loci_order" (List[str]): Loci in profile-column order.
+              - "probes" (bytes): Multi-FASTA of each locus's first record.
+              - "src_mtime" (float): Newest source mtime the index was built from.
+    """
+    # Step 1: Scan the source files and derive the freshness key. One
+    # scandir pass yields name and stat per entry without the per-file
+    # Path construction and extra stat syscalls of glob.
+    index_file = species_db_dir / ".mlst_index.pkl"
+    profile_file = None
+    src_mtime = 0.0
+    with os.scandir(species_db_dir) as it:
+        for entry in it:
+            if entry.name.endswith(".txt"):
+                if profile_file is None:
+                    profile_file = Path(entry.path)
+            elif not entry.name.endswith(".tfa"):
+                continue
+            src_mtime = max(src_mtime, entry.stat().st_mtime)
+
+    # Step 2: Reuse the pickled index when it matches the sources.
+    if index_file.exists():
+        try:
+            with open(index_file, "rb") as f:
+                index = pickle.load(f)
+            if index.get("src_mtime") == src_mtime:
+                return index
+        except Exception:
+            pass  # Corrupt or incompatible index; rebuild below.
+
+    # Step 3: Rebuild — loci order from the profile header, probe records
+    # from the first entry of each locus TFA.
+    loci_order: List[str] = []
+    if profile_file is not None:
+        with open(profile_file, "r") as f:
+            loci_order = f.readline().strip().split('\t')[1:]
+
+    probes = bytearray()
+    for locus in loci_order:
+        locus_file = species_db_dir / f"{locus}.tfa"
+        if locus_file.exists():
+            header, seq = first_fasta_record(locus_file)
+            probes += header
+            probes += seq + b"\n"
+
+    index = {"src_mtime": src_mtime, "loci_order": loci_order, "probes": bytes(probes)}
+
+    # Step 4: Write the index atomically so a concurrent reader never loads
+    # a partial pickle.
+    partial_file = index_file.with_suffix(".pkl.part")
+    with open(partial_file, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    partial_file.replace(index_file)
+    return index
+
+
+def build_st_index(profile_file: Path) -> Dict[str, Any]:
+    """
+    Loads (or rebuilds) the pickled allele-tuple -> ST lookup for a profile.
+
+    The ST profile table only changes when the MLST database is updated, so
+    the lookup dict is built once and pickled next to the TXT, keyed by the
+    profile's mtime. Warm runs load the pickle and answer every ST query as
+    an O(1) dict hit instead of re-parsing the table.
+
+    Args:
+        profile_file (Path): The tab-separated ST profile table (ST column
+                             first, one column per locus after it).
+
+    Returns:
+        dict: An index with keys:
+              - "key_cols" (List[str]): Locus columns in profile order.
+              - "lookup" (Dict[tuple, str]): tuple(allele numbers) -> ST.
+              - "src_mtime" (float): Profile mtime the index was built from.
+    """
+    # Step 1: Stat the profile and try the pickled index first.
+    index_file = profile_file.parent / f".{profile_file.stem}.st_index.pkl"
+    src_mtime = profile_file.stat().st_mtime
+
+    if index_file.exists():
+        try:
+            with open(index_file, "rb") as f:
+                index = pickle.load(f)
+            if index.get("src_mtime") == src_mtime:
+                return index
+        except Exception:
+            pass  # Corrupt or incompatible index; rebuild below.
+
+    # Step 2: Rebuild with a single csv pass. All fields stay strings, which
+    # is exactly the form the allele profile is compared in.
+    with open(profile_file, newline="") as f:
+        reader = csv.reader(f, delimiter="\t")
+        header = next(reader, [])
+        key_cols = header[1:]
+        n_loci = len(key_cols)
+        lookup = {tuple(row[1:n_loci + 1]): row[0] for row in reader if len(row) > n_loci}
+
+    index = {"src_mtime": src_mtime, "key_cols": key_cols, "lookup": lookup}
+
+    # Step 3: Write atomically so a concurrent reader never loads a partial
+    # pickle (same pattern as the MLST database index).
+    partial_file = index_file.with_suffix(".pkl.part")
+    with open(partial_file, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    partial_file.replace(index_file)
+    return index
+
+
 def setup_mlst_parameters(genome_file: Path, logger: Logger) -> Dict[str, Any]:
     """
     Identifies the species from the genome folder structure and prepares MLST-specific parameters.
@@ -96,7 +411,10 @@ def setup_mlst_parameters(genome_file: Path, logger: Logger) -> Dict[str, Any]:
     logger.log_step("MLST", "1_2_Species_Database_Found", f"MLST database found for species '{species_dir}' at '{species_db_dir}'")
 
     # Step 4: Find the MLST profile file (e.g., klebsiella.txt) in the database directory.
-    profile_file = next(species_db_dir.glob("*.txt"), None)
+    profile_file = next(
+        (Path(e.path) for e in os.scandir(species_db_dir) if e.name.endswith(".txt")),
+        None,
+    )
     if not profile_file:
         raise FileNotFoundError(f"MLST profile file (.txt) not found in '{species_db_dir}'")
 
@@ -132,6 +450,10 @@ def get_genome_name(genome_file: Path) -> str:
     Raises:
         ValueError: If the FASTA file is empty or not in a valid format.
     """
+    # Deferred import: Biopython costs ~50 ms at startup and this is its
+    # only use in the module.
+    from Bio import SeqIO
+
     try:
         first_record = next(SeqIO.parse(genome_file, "fasta"))
         return first_record.id
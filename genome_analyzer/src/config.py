@@ -41,3 +41,16 @@ ANALYSES_TO_RUN = {
     "plasmidfinder_db": "Plasmid_Replicons",
     "mefinder_db": "Mobile_Genetic_Elements",
 }
+
+# --- Search Tool per Database ---
+# Standard analyses run `blastn` by default. A database folder whose
+# reference is protein-level can be mapped to "diamond" here to run
+# `diamond blastx` (orders of magnitude faster for translated searches)
+# against a pre-built `.dmnd` database in the folder. The genome is the
+# blastx query, but the wrapper's outfmt puts the subject (gene) fields
+# first so the result TSV keeps the usual gene-then-contig column order.
+# The folders shipped above are all nucleotide, so none are mapped by
+# default.
+ANALYSIS_TOOLS = {
+    # "some_protein_db": "diamond",
+}
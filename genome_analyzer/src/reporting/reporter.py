@@ -5,12 +5,17 @@ This module is responsible for parsing all analysis results and generating
 the final, human-readable 'One Page ME Report'. It consolidates data from
 MLST, AMR, plasmid, and MGE analyses into a single text file.
 """
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import pandas as pd
 
 # Project-level module imports
+from analysis.utils import best_hits_by_qseqid
 from config import ANALYSES_TO_RUN
 
+# Reverse map built once at import: analysis name -> database folder.
+# Avoids a linear scan of ANALYSES_TO_RUN per reported analysis.
+_NAME_TO_DB = {name: db for db, name in ANALYSES_TO_RUN.items()}
+
 def create_final_report(results_data: dict, results_dir: Path, genome_name: str):
     """
     Generates the final summary report from the collected analysis data.
@@ -33,71 +38,87 @@ def create_final_report(results_data: dict, results_dir: Path, genome_name: str)
     mlst_params = results_data.get('mlst_params', {})
     mlst_results = results_data.get('mlst', {})
     
-    # Step 3: Open the report file for writing.
-    with open(report_path, "w") as f:
-        # --- Section A: Header ---
-        # Step 4: Write the main title and basic sample information.
-        f.write("========== One Page ME Report ==========\n\n")
-        f.write(f"■ ID: {genome_name}\n")
-        f.write(f"■ Species: {mlst_params.get('species', 'Unknown')}\n\n")
-
-        # --- Section B: MLST Results ---
-        # Step 5: Write the Molecular Epidemiology section, focusing on MLST.
-        f.write("--- Molecular Epidemiology ---\n")
-        st = mlst_results.get('st', 'Not determined')
-        profile = mlst_results.get('alleles', {})
-        profile_str = ", ".join([f"{locus}-{num}" for locus, num in profile.items()])
-        f.write(f"▶ MLST: {st}\n")
-        f.write(f"  Allele Profile: {profile_str}\n\n")
-
-        # --- Section C: Other BLAST Analyses ---
-        # Step 6: Loop through all analyses defined in the config to report their results.
-        col_names = ['qseqid', 'sseqid', 'pident', 'length', 'mismatch', 'gapopen', 'qstart', 'qend', 'sstart', 'send', 'evalue', 'bitscore']
-        
-        # A dictionary to group analyses under common headers.
-        analysis_groups = {
-            "Antimicrobial Resistance Determinants": ["Antimicrobial_Resistance"],
-            "Mobile Genetic Elements": ["Plasmid_Replicons", "Mobile_Genetic_Elements"]
-        }
-
-        # Step 7: Process each analysis group.
-        for group_title, analysis_names in analysis_groups.items():
-            f.write(f"--- {group_title} ---\n")
-            found_any_in_group = False
-
-            # Step 8: Process each analysis within the group.
-            for analysis_name in analysis_names:
-                # Find the corresponding db_folder from ANALYSES_TO_RUN
-                db_folder = next((db for db, name in ANALYSES_TO_RUN.items() if name == analysis_name), None)
-                if not db_folder:
-                    continue
-
-                # Determine the subtitle for the analysis.
-                if "Resistance" in analysis_name:
-                    subtitle = "Acquired Genes"
-                elif "Replicons" in analysis_name:
-                    subtitle = "Plasmid Replicons"
-                else:
-                    subtitle = "Other MGEs"
-                f.write(f"▶ {subtitle}:\n")
-
-                # Step 9: Read the BLAST result file for the current analysis.
-                result_file = results_dir / analysis_name / "blast_results.tsv"
-                try:
-                    df = pd.read_csv(result_file, sep='\t', names=col_names)
-                    if df.empty:
-                        # Step 10a: If no hits, report that.
-                        f.write("  - No significant hits found.\n")
-                    else:
-                        # Step 10b: If hits are found, get the best hit for each query sequence.
-                        best_hits = df.loc[df.groupby('qseqid')['bitscore'].idxmax()]
-                        for _, row in best_hits.iterrows():
-                            f.write(f"  - {row['qseqid']:<25} (Identity: {row['pident']:.2f}%, Contig: {row['sseqid']})\n")
-                        found_any_in_group = True
-                except (FileNotFoundError, pd.errors.EmptyDataError):
-                    # Step 10c: Handle cases where the result file doesn't exist or is empty.
-                    f.write("  - No significant hits found.\n")
-            f.write("\n")
-
-    # Step 11: Print a final confirmation message to the console.
+    # Step 3: Accumulate the report in memory and write it once at the end.
+    # Many tiny writes on a text stream each pay per-call and encoding
+    # overhead; one join + one write_text is a single syscall.
+    parts = []
+
+    # --- Section A: Header ---
+    # Step 4: Write the main title and basic sample information.
+    parts.append("========== One Page ME Report ==========\n\n")
+    parts.append(f"■ ID: {genome_name}\n")
+    parts.append(f"■ Species: {mlst_params.get('species', 'Unknown')}\n\n")
+
+    # --- Section B: MLST Results ---
+    # Step 5: Write the Molecular Epidemiology section, focusing on MLST.
+    parts.append("--- Molecular Epidemiology ---\n")
+    st = mlst_results.get('st', 'Not determined')
+    profile = mlst_results.get('alleles', {})
+    profile_str = ", ".join([f"{locus}-{num}" for locus, num in profile.items()])
+    parts.append(f"▶ MLST: {st}\n")
+    parts.append(f"  Allele Profile: {profile_str}\n\n")
+
+    # --- Section C: Other BLAST Analyses ---
+    # Step 6: Loop through all analyses defined in the config to report their results.
+    # A dictionary to group analyses under common headers.
+    analysis_groups = {
+        "Antimicrobial Resistance Determinants": ["Antimicrobial_Resistance"],
+        "Mobile Genetic Elements": ["Plasmid_Replicons", "Mobile_Genetic_Elements"]
+    }
+
+    # Step 7: Resolve each group's analyses and result files up front.
+    sections = []
+    for group_title, analysis_names in analysis_groups.items():
+        entries = []
+        for analysis_name in analysis_names:
+            # Find the corresponding db_folder from ANALYSES_TO_RUN
+            db_folder = _NAME_TO_DB.get(analysis_name)
+            if not db_folder:
+                continue
+
+            # Determine the subtitle for the analysis.
+            if "Resistance" in analysis_name:
+                subtitle = "Acquired Genes"
+            elif "Replicons" in analysis_name:
+                subtitle = "Plasmid Replicons"
+            else:
+                subtitle = "Other MGEs"
+            entries.append((subtitle, results_dir / analysis_name / "blast_results.tsv"))
+        sections.append((group_title, entries))
+
+    # Step 8: Reduce every result file to its best hit per query, reading
+    # the independent TSVs concurrently: the reads are I/O-bound and
+    # release the GIL, so a thread pool overlaps their disk latency.
+    result_files = [result_file for _, entries in sections for _, result_file in entries]
+    best_hits_by_file = {}
+    if result_files:
+        with ThreadPoolExecutor(max_workers=len(result_files)) as pool:
+            best_hits_by_file = dict(zip(result_files, pool.map(best_hits_by_qseqid, result_files)))
+
+    # Step 9: Assemble the sections in their original order.
+    for group_title, entries in sections:
+        parts.append(f"--- {group_title} ---\n")
+        found_any_in_group = False
+
+        for subtitle, result_file in entries:
+            parts.append(f"▶ {subtitle}:\n")
+            best_hits = best_hits_by_file[result_file]
+            if not best_hits:
+                # Step 10a: If no hits (or no result file), report that.
+                parts.append("  - No significant hits found.\n")
+            else:
+                # Step 10b: Emit each query's best hit in a stable order,
+                # assembled as one string per section.
+                parts.extend(
+                    "  - %-25s (Identity: %.2f%%, Contig: %s)\n"
+                    % (qseqid, float(best_hits[qseqid][2]), best_hits[qseqid][1])
+                    for qseqid in sorted(best_hits)
+                )
+                found_any_in_group = True
+        parts.append("\n")
+
+    # Step 11: Join the accumulated sections and write the report in one go.
+    report_path.write_text("".join(parts), encoding="utf-8")
+
+    # Step 12: Print a final confirmation message to the console.
     print(f"✅ Final report created at: {report_path}")
\ No newline at end of file